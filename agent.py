@@ -1,35 +1,78 @@
-import random
+from collections import deque
 import numpy as np
-import heapq
+
+from random_streams import RandomStream
+
+# Fixed-size state of one agent and the NumPy dtype it is stored with in bulk
+AGENT_STATE_SCHEMA = (
+    ('unique_id', np.int64),
+    ('start_position', (np.int64, 2)),
+    ('end_position', (np.int64, 2)),
+    ('current_position', (np.int64, 2)),
+    ('comp', np.bool_),
+    ('littering', np.bool_),
+    ('cleaning', np.bool_),
+    ('compliant_prob', np.float64),
+    ('initial_compliant_prob', np.float64),
+    ('trash_count', np.int64),
+    ('reward', np.float64),
+    ('litter_count', np.int64),
+    ('trip_id', np.int64),
+    ('sanctioned', np.int64),
+    ('steps_since_start', np.int64),
+    ('was_sanctioned', np.bool_),
+    ('has_littered_this_trip', np.bool_),
+    ('used_bin_this_trip', np.bool_),
+    ('first_bin_use_time', np.int64),  # -1 until the agent first uses a bin
+    ('is_dead', np.bool_),
+)
+AGENT_STATE_DTYPE = np.dtype(list(AGENT_STATE_SCHEMA))
 
 class CleaningAgent:
-    def __init__(self, unique_id, start_position, end_position, initial_compliant_prob):
+    __slots__ = tuple(name for name, _ in AGENT_STATE_SCHEMA) + (
+        'path', 'observation', 'action', 'litter_history', 'trip_durations', 'rng'
+    )
+
+    def __init__(self, unique_id, start_position, end_position, initial_compliant_prob, history_length=None, rng=None):
         self.unique_id = unique_id
         self.start_position = start_position
         self.end_position = end_position
+        self.current_position = start_position
         self.comp = False
         self.littering = False
         self.cleaning = False
         self.compliant_prob = initial_compliant_prob
         self.initial_compliant_prob = initial_compliant_prob
         self.trash_count = 1
-        self.path = []
         self.reward = 0
-        self.current_position = start_position
         self.litter_count = 0
-        self.litter_history = []
         self.trip_id = 0
-        self.observation = {}
         self.sanctioned = 0
-        self.action = None  # To store the chosen action
         self.steps_since_start = 0
         self.was_sanctioned = False
         self.has_littered_this_trip = False
-        self.steps_since_start = 0
-        self.trip_durations = []  # To store durations of each trip
+        self.used_bin_this_trip = False
         self.first_bin_use_time = None # To store the timestep when the agent first uses the bin
-        self.was_sanctioned = False
         self.is_dead = False
+        self.path = []
+        self.observation = {}
+        self.action = None  # To store the chosen action
+        # Stream the agent's own decisions are drawn from; GridWorld passes its run stream or one per agent
+        self.rng = rng if rng is not None else RandomStream()
+        # Per-agent history is kept only when asked for, and then only the last history_length entries
+        if history_length:
+            self.litter_history = deque(maxlen=history_length)
+            self.trip_durations = deque(maxlen=history_length)  # To store durations of each trip
+        else:
+            self.litter_history = None
+            self.trip_durations = None
+
+    def get_state(self):
+        # One record of AGENT_STATE_DTYPE
+        return tuple(
+            -1 if name == 'first_bin_use_time' and self.first_bin_use_time is None else getattr(self, name)
+            for name, _ in AGENT_STATE_SCHEMA
+        )
 
     def sigmoid(self, x, k, x0):
         return 1 / (1 + np.exp(-k * (x - x0)))
@@ -39,16 +82,18 @@ class CleaningAgent:
         w = env.observation_radius  # Observation radius
         agent_positions = env.get_agents_within_radius(self.current_position, w,exclude_agent_id=self.unique_id)
 
-        # Get previous actions for agents within radius
+        # Get previous actions for agents within radius, looked up per neighbour rather than scanning every agent
         previous_actions_all = env.agent_actions_history.get(env.step_id - 1, {})
-        previous_actions = {agent_id: action for agent_id, action in previous_actions_all.items() if agent_id in agent_positions}
+        previous_actions = {agent_id: previous_actions_all[agent_id] for agent_id in agent_positions if agent_id in previous_actions_all}
 
         self.observation = {
             'current_state': {
                 'agent_positions': agent_positions,
-                'trash_locations': dict(env.trash)
+                'trash_locations': env.trash_view
             },
-            'previous_actions': previous_actions
+            'previous_actions': previous_actions,
+            # Agents in view that sanctioned this agent last step
+            'sanctioned_by': [other_agent_id for other_agent_id in env.get_sanctioners_of(env.step_id - 1, self.unique_id) if other_agent_id in agent_positions]
         }
         self.observation['sanctioned_agents'] = {}
         for other_agent_id in agent_positions:
@@ -70,10 +115,8 @@ class CleaningAgent:
                 return  # Only perform one action per timestep
             else:
                 # No trash at current position, agent moves towards nearest trash
-                trash_positions = [pos for pos, count in env.trash.items() if count > 0]
-                if trash_positions:
-                    nearest_trash = min(trash_positions, key=lambda pos: self.heuristic(pos, self.current_position, env))
-                    self.path = self.find_path(env, nearest_trash)
+                if env.has_trash():
+                    self.path = env.get_path_to_nearest_trash(self.current_position)
                     if self.path:
                         next_pos = self.path.pop(0)
                         self.action['move'] = next_pos
@@ -112,6 +155,8 @@ class CleaningAgent:
             replan_needed = True
 
         if replan_needed:
+            if env.instrumentation is not None:
+                env.instrumentation.count('replans')
             # Re-plan the path
             self.path, _ = self.choose_path(env)
             if not self.path:
@@ -128,13 +173,12 @@ class CleaningAgent:
         
 
         # Finally, decide whether to sanction
-        if (env.method == "Decentralised" or (env.method == "Hybrid" and random.random() < env.b)):
+        if (env.method == "Decentralised" or (env.method == "Hybrid" and self.rng.random() < env.b)):
             sanction_targets = []
             # if self.comp and self.current_position not in env.house_positions + env.office_position:
             if self.comp:
-                for other_agent_id, other_action in self.observation['previous_actions'].items():
-                    if other_action.get('action') == 'litter':
-                        sanction_targets.append(other_agent_id)
+                # Agents in view that littered last step, from the step's event index
+                sanction_targets = env.get_litterers_within_radius(env.step_id - 1, self.current_position, env.observation_radius, exclude_agent_id=self.unique_id)
             if sanction_targets:
                 self.action['action'] = 'sanction'
                 self.action['target_agent_ids'] = sanction_targets
@@ -147,7 +191,7 @@ class CleaningAgent:
     def update_internal_state(self, env):
         # Reset compliance at start position
         if self.current_position == self.start_position:
-            self.comp = random.random() < self.compliant_prob
+            self.comp = self.rng.random() < self.compliant_prob
             self.trash_count += 1  
             self.steps_since_start = 0 
             self.has_littered_this_trip = False
@@ -164,7 +208,8 @@ class CleaningAgent:
                 env.total_sanctions += 1
             
             self.compliant_prob = self.sigmoid(self.sanctioned, k=0.5, x0=0)
-            self.trip_durations.append(self.steps_since_start)
+            if self.trip_durations is not None:
+                self.trip_durations.append(self.steps_since_start)
             self.steps_since_start = 0  # Reset for the next trip
             self.used_bin_this_trip = False
             self.has_littered_this_trip = False 
@@ -191,13 +236,7 @@ class CleaningAgent:
             #     self.sanctioned -=  num_events # Only decrease once per timestep
 
             # Count events where the agent was sanctioned
-            num_events2 = sum(
-                1 for other_action in self.observation['previous_actions'].values()
-                if (
-                    other_action.get('action') == 'sanction' and
-                    self.unique_id in other_action.get('target_agent_ids', [])
-                )
-            )
+            num_events2 = len(self.observation['sanctioned_by'])
 
             # Update self.sanctioned based on sanctions received
             if num_events2 > 0:
@@ -209,7 +248,7 @@ class CleaningAgent:
         choices = [pos for pos in env.house_positions + env.office_position + env.park_positions if pos != self.start_position and pos != self.end_position]
         if not choices:
             return self.current_position  
-        next_destination = random.choice(choices)
+        next_destination = self.rng.choice(choices)
         return next_destination
     
     def find_nearest_trash_bin(self, env):
@@ -244,42 +283,7 @@ class CleaningAgent:
             return direct_path, "direct"
 
     def find_path(self, env, goal):
-        frontier = []
-        heapq.heappush(frontier, (0, self.current_position))
-        came_from = {self.current_position: None}
-        cost_so_far = {self.current_position: 0}
-        visited = set()
-        
-
-        while frontier:
-            _, current = heapq.heappop(frontier)
-            if current == goal:
-                return self.reconstruct_path(came_from, goal)
-            visited.add(current)
-            for next in env.get_neighborhood(current):
-                if not env.is_passable(next):
-                    continue  # Skip impassable cells
-                movement_cost = 1  
-                new_cost = cost_so_far[current] + movement_cost
-                if next not in cost_so_far or new_cost < cost_so_far[next]:
-                    cost_so_far[next] = new_cost
-                    # priority = new_cost + self.heuristic(goal, next, env)
-                    priority = new_cost + self.heuristic(goal, next, env) + random.uniform(0, 0.1)
-                    heapq.heappush(frontier, (priority, next))
-                    came_from[next] = current
-
-        # If we reach here, no path was found
-        return []
-
-
-    def reconstruct_path(self, came_from, goal):
-        current = goal
-        path = []
-        while current:
-            path.append(current)
-            current = came_from[current]
-        path.reverse()
-        return path
+        return env.get_path(self.current_position, goal)
 
     def heuristic(self, a, b, env):
         # Direct path heuristic
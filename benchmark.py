@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Windows: peak memory is reported as unavailable (None)
+    resource = None
+
+from env import GridWorld
+from sweep_config import world_sizes, agent_densities, run_seed
+from utils import initial_map
+from vector_env import VectorGridWorld
+from sharded_env import ShardedGridWorld
+
+methods = ["Centralised-end", "Decentralised", "Hybrid", "Centralised-ts"]
+
+# Larger settings on top of the ones main.py sweeps
+stress_world_sizes = {
+    'Stress': (100, 100),
+}
+stress_agent_densities = {
+    'Sparse': {'Stress': 100},
+    'Dense': {'Stress': 1000},
+}
+
+
+def peak_rss_mb(children=False):
+    # ru_maxrss is in kilobytes on Linux
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_case(case):
+    # Runs in a fresh worker process so the peak RSS belongs to this case alone;
+    # the RSS before setup is the interpreter and imports, reported as the baseline
+    baseline_rss_mb = peak_rss_mb()
+    seed = run_seed(case['seed'], case['world_size'], case['density'], case['method'], 0)
+    width, height = case['width'], case['height']
+    num_agents = case['num_agents']
+    house_positions, office_positions, park_positions, trash_bins = initial_map(num_agents, width, height)
+
+    start = time.perf_counter()
+    if case['engine'] == 'vector':
+        env = VectorGridWorld(width, height, num_agents, case['method'], case['b'], [0.5] * num_agents,
+                              house_positions, office_positions, park_positions, trash_bins, 0, case['t'], case['w'], seed=seed)
+    elif case['engine'] == 'sharded':
+        env = ShardedGridWorld(width, height, num_agents, case['method'], case['b'], [0.5] * num_agents,
+                               house_positions, office_positions, park_positions, trash_bins, 0, case['t'], case['w'], seed=seed, shards=case['shards'])
+    else:
+        env = GridWorld(width, height, num_agents, case['method'], case['b'], [0.5] * num_agents,
+                        house_positions, office_positions, park_positions, trash_bins, 0, case['t'], case['w'], seed=seed)
+    setup_time = time.perf_counter() - start
+
+    # One run_env call per step so every step is timed on its own; reserving the
+    # metric rows up front keeps the recorder from reallocating inside the timings
+    env.recorder.reserve(case['steps'])
+    step_times = np.empty(case['steps'])
+    for step in range(case['steps']):
+        start = time.perf_counter()
+        env.run_env(1)
+        step_times[step] = time.perf_counter() - start
+
+    if case['engine'] == 'sharded':
+        env.close()
+
+    total = step_times.sum()
+    return dict(case,
+                setup_seconds=setup_time,
+                total_seconds=total,
+                steps_per_second=case['steps'] / total,
+                latency_ms={f'p{q}': float(np.percentile(step_times, q) * 1000) for q in (50, 90, 99)},
+                latency_max_ms=float(step_times.max() * 1000),
+                peak_rss_mb=peak_rss_mb(),
+                baseline_rss_mb=baseline_rss_mb,
+                # Largest shard process of a sharded run
+                peak_child_rss_mb=peak_rss_mb(children=True),
+                final_compliance=float(env.compliance_over_time[-1]),
+                final_cleanliness=float(env.cleanliness_over_time[-1]))
+
+
+def build_cases(args):
+    sizes = dict(world_sizes)
+    densities = {name: dict(nums) for name, nums in agent_densities.items()}
+    if args.stress:
+        sizes.update(stress_world_sizes)
+        for name, nums in stress_agent_densities.items():
+            densities.setdefault(name, {}).update(nums)
+
+    cases = []
+    for world_size_name, (width, height) in sizes.items():
+        for density_name, agent_nums in densities.items():
+            if world_size_name not in agent_nums:
+                continue
+            for method in args.methods:
+                cases.append({
+                    'world_size': world_size_name,
+                    'density': density_name,
+                    'method': method,
+                    'engine': args.engine,
+                    'width': width,
+                    'height': height,
+                    'num_agents': agent_nums[world_size_name],
+                    'steps': args.steps,
+                    'b': 0.5,
+                    't': 10,
+                    'w': 1,
+                    'seed': args.seed,
+                    'shards': args.shards,
+                })
+    return cases
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    keyed = {(r['world_size'], r['density'], r['method'], r['engine']): r for r in baseline['results']}
+    print(f'\nCompared with {baseline_path} ({baseline.get("revision")}):')
+    for r in results:
+        old = keyed.get((r['world_size'], r['density'], r['method'], r['engine']))
+        if old is None:
+            continue
+        speedup = r['steps_per_second'] / old['steps_per_second']
+        print(f'{r["world_size"]:>7} {r["density"]:>8} {r["method"]:>16}  {speedup:6.2f}x steps/sec')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure simulation throughput for every method and configuration.')
+    parser.add_argument('--steps', type=int, default=400)
+    parser.add_argument('--methods', nargs='+', default=methods)
+    parser.add_argument('--engine', choices=['scalar', 'vector', 'sharded'], default='scalar')
+    parser.add_argument('--shards', type=int, default=2, help='worker processes for --engine sharded')
+    parser.add_argument('--stress', action='store_true', help='also run the larger stress settings')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='JSON file to write (default: results/benchmark_<revision>.json)')
+    parser.add_argument('--compare', default=None, help='earlier benchmark JSON to compare steps/sec against')
+    args = parser.parse_args()
+
+    results = []
+    # One process per case, one at a time, so timings do not compete for cores
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+        for result in executor.map(bench_case, build_cases(args)):
+            print(f'{result["world_size"]:>7} {result["density"]:>8} {result["method"]:>16}  '
+                  f'{result["steps_per_second"]:9.1f} steps/s  p50 {result["latency_ms"]["p50"]:7.2f} ms  '
+                  f'p99 {result["latency_ms"]["p99"]:7.2f} ms  peak {result["peak_rss_mb"] or float("nan"):7.1f} MB')
+            results.append(result)
+
+    revision = git_revision()
+    output = args.output or f'results/benchmark_{revision or "local"}.json'
+    if os.path.dirname(output) and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, 'w') as f:
+        json.dump({
+            'revision': revision,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'results': results,
+        }, f, indent=2)
+    print(f'Wrote {output}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,36 @@
-import random
-import pygame
-from collections import defaultdict
-import pandas as pd
+import pickle
+from collections import defaultdict, OrderedDict
+import numpy as np
 
 from agent import CleaningAgent
+from random_streams import RandomStream
+from recorder import MetricsRecorder
+
+# Cells holding more trash than this (bins excepted) cannot be entered
+MAX_PASSABLE_TRASH = 3
+# Draws per block of an agent's own stream; agents draw a few times per trip
+AGENT_BLOCK_SIZE = 64
 
 class GridWorld:
-    def __init__(self, width, height, num_agents, method, b, initial_compliant_probs, house_positions, office_position, park_positions, trash_bins,num_run,t,observation_radius):
+    def __init__(self, width, height, num_agents, method, b, initial_compliant_probs, house_positions, office_position, park_positions, trash_bins,num_run,t,observation_radius, observers=None, agent_history=None, history_depth=1, instrumentation=None, scenario=None, seed=None, agent_streams=False):
         self.width = width
         self.height = height
         self.num_agents = num_agents
         self.agents = []
-        self.trash = defaultdict(int)
+        self.agents_by_id = {}
+        # Spatial index: cell -> ids of the agents standing on it
+        self.agents_by_cell = defaultdict(set)
+        # Dense trash counts indexed by [x, y] plus a running count of empty cells
+        self.trash = np.zeros((width, height), dtype=np.int32)
+        self.clean_cells = width * height
+        # Read-only view shared by every agent's observation; copy it to keep values
+        self.trash_view = self.trash.view()
+        self.trash_view.flags.writeable = False
         self.round_id = 0
         self.step_id = 0
+        # Steps completed so far; run_env carries on from here
+        self.steps_done = 0
+        self.time_since_last_check = 0
         self.b = b
         self.cell_size = 30
         self.method = method
@@ -22,175 +39,283 @@ class GridWorld:
         self.office_position = office_position
         self.park_positions = park_positions
         self.trash_bins = trash_bins
-        self.agent_actions_history = {}
+        self.passable = np.ones((width, height), dtype=bool)
+        # Goal -> BFS distance grid shared by every agent heading there;
+        # cleared only when a cell changes passability
+        self.flow_fields = {}
+        if scenario is not None:
+            # A scenarios.Scenario of this map has the empty-map fields already
+            for goal, field in zip(scenario.goals.tolist(), scenario.goal_fields):
+                self.flow_fields[divmod(goal, height)] = field.reshape(width, height)
+        # Multi-source distance field to the nearest enterable trash cell, rebuilt lazily
+        self.trash_field = None
+        # Actions and event index of the last history_depth steps, keyed by step;
+        # agents only ever read the previous step
+        if history_depth < 1:
+            raise ValueError(f'history_depth must be at least 1, got {history_depth}')
+        self.history_depth = history_depth
+        self.agent_actions_history = OrderedDict()
+        self.step_events = OrderedDict()
         self.littering_agents = set()
         self.t=t
         self.observation_radius = observation_radius
-        self.compliance_over_time = []
-        self.cleanliness_over_time = []
-        self.total_sanctions_over_time = []
+        # Per-agent trajectories and run-level series, one row per step
+        self.recorder = MetricsRecorder(num_agents)
         self.total_sanctions = 0
         self.dead_agents_count = 0
+        # Agents that proposed the same cell in the last apply_actions
+        self.move_conflicts = 0
+        # Step at which an observer (e.g. stopping.ConvergenceStop) ended the run early
+        self.stop_step = None
+        # Observers (e.g. render.PygameRenderer) are notified around every step;
+        # without any the simulation runs headless and never imports pygame.
+        self.observers = list(observers) if observers else []
+        # Optional instrumentation.Instrumentation; None keeps run_env free of timing calls
+        self.instrumentation = instrumentation
+        # Every draw of the run comes from the run's own streams, derived from seed; with
+        # agent_streams each agent draws its own decisions from a stream of its own
+        self.agent_streams = agent_streams
+        self.reseed(seed)
 
         for i in range(num_agents):
             start_position = self.house_positions[i % len(self.house_positions)]
-            end_position = random.choice([pos for pos in self.office_position + self.park_positions + self.house_positions if pos != start_position])
-            agent = CleaningAgent(i, start_position, end_position, initial_compliant_probs[i])
+            end_position = self.rng.choice([pos for pos in self.office_position + self.park_positions + self.house_positions if pos != start_position])
+            agent = CleaningAgent(i, start_position, end_position, initial_compliant_probs[i], history_length=agent_history, rng=self.agent_rng(i))
             self.agents.append(agent)
+            self.agents_by_id[agent.unique_id] = agent
+            self.agents_by_cell[start_position].add(agent.unique_id)
 
-        self.clean_squares_record = []
         self.trip_steps = []
-        # self.load_images()
 
-    def get_agents_within_radius(self, position, radius, exclude_agent_id=None):
-        agents_in_radius = {}
+    @property
+    def compliance_over_time(self):
+        return self.recorder.series('average_compliance')
+
+    @property
+    def cleanliness_over_time(self):
+        return self.recorder.series('cleanliness')
+
+    @property
+    def total_sanctions_over_time(self):
+        return self.recorder.series('total_sanctions')
+
+    @property
+    def clean_squares_record(self):
+        return self.recorder.series('clean_squares')
+
+    def cells_within_radius(self, position, radius):
+        # The cells inside the Manhattan ball around position
         x0, y0 = position
-        for agent in self.agents:
-            if agent.unique_id == exclude_agent_id:
-                continue  # Skip the agent itself
-            x1, y1 = agent.current_position
-            distance = abs(x1 - x0) + abs(y1 - y0)  # Manhattan distance
-            if distance <= radius:
-                agents_in_radius[agent.unique_id] = agent.current_position
-        return agents_in_radius
+        for x in range(max(0, x0 - radius), min(self.width, x0 + radius + 1)):
+            span = radius - abs(x - x0)
+            for y in range(max(0, y0 - span), min(self.height, y0 + span + 1)):
+                yield (x, y)
 
+    def get_agents_within_radius(self, position, radius, exclude_agent_id=None):
+        found = []
+        for cell in self.cells_within_radius(position, radius):
+            ids = self.agents_by_cell.get(cell)
+            if ids:
+                found.extend(ids)
+        found.sort()
+        return {agent_id: self.agents_by_id[agent_id].current_position for agent_id in found if agent_id != exclude_agent_id}
+
+    def get_litterers_within_radius(self, step, position, radius, exclude_agent_id=None):
+        litterers_by_cell = self.step_events.get(step, {}).get('litterers_by_cell')
+        if not litterers_by_cell:
+            return []
+        found = []
+        for cell in self.cells_within_radius(position, radius):
+            ids = litterers_by_cell.get(cell)
+            if ids:
+                found.extend(ids)
+        found.sort()
+        return [agent_id for agent_id in found if agent_id != exclude_agent_id]
+
+    def get_sanctioners_of(self, step, agent_id):
+        return self.step_events.get(step, {}).get('sanctions_by_target', {}).get(agent_id, [])
+
+    def record_step(self, step, actions, events):
+        self.agent_actions_history[step] = actions
+        self.step_events[step] = events
+        while len(self.agent_actions_history) > self.history_depth:
+            self.agent_actions_history.popitem(last=False)
+            self.step_events.popitem(last=False)
 
     def get_agent_by_id(self, agent_id):
-        for agent in self.agents:
-            if agent.unique_id == agent_id:
-                return agent
-        return None
-    
-  
+        return self.agents_by_id.get(agent_id)
+
+    def move_agent(self, agent, new_position):
+        old_position = agent.current_position
+        if new_position == old_position:
+            return
+        ids = self.agents_by_cell[old_position]
+        ids.discard(agent.unique_id)
+        if not ids:
+            del self.agents_by_cell[old_position]
+        self.agents_by_cell[new_position].add(agent.unique_id)
+        agent.current_position = new_position
+
     def get_average_compliance_over_time(self):
         return self.compliance_over_time
 
     def run_env(self, steps):
-        pygame.init()
-        cell_size = 30
-        screen = pygame.display.set_mode((self.width * cell_size, self.height * cell_size))
-        clock = pygame.time.Clock()
+        for observer in self.observers:
+            observer.on_start(self)
 
-        agents_data = {agent.unique_id: {'steps': [], 'comp_probs': [], 'sanctions': []} for agent in self.agents}
+        self.recorder.reserve(steps)
 
-        time_since_last_check = 0
-
-        for step in range(steps):
+        for step in range(self.steps_done, self.steps_done + steps):
             self.step_id = step
+            inst = self.instrumentation
+            if inst is not None:
+                inst.begin_step(step)
+                sanctions_before = self.total_sanctions
 
             # Step 1: Each agent observes the state
             for agent in self.agents:
                 agent.observe(self)
+            if inst is not None:
+                inst.lap('observe')
 
             # Step 2: Each agent decides on an action
             for agent in self.agents:
                 agent.choose_action(self)
+            if inst is not None:
+                inst.lap('choose_action')
 
             # Step 3: Collect all actions
             actions = {agent.unique_id: agent.action for agent in self.agents}
 
-            # Record the actions
-            self.agent_actions_history[step] = actions
-
-            # Step 4: Apply all actions 
-            self.apply_actions(actions)
+            # Step 4: Apply all actions and record them with their event index
+            events = self.apply_actions(actions)
+            self.record_step(step, actions, events)
+            if inst is not None:
+                inst.lap('apply_actions')
 
-            time_since_last_check += 1
-            if self.method == 'Centralised-ts' and time_since_last_check == self.t:
+            self.time_since_last_check += 1
+            if self.method == 'Centralised-ts' and self.time_since_last_check == self.t:
                 for agent_id in self.littering_agents:
                     agent = self.get_agent_by_id(agent_id)
                     agent.sanctioned += 1
                     # agent.compliant_prob = agent.sigmoid(agent.sanctioned, k=0.5, x0=0)
                     agent.has_littered_this_trip = False
-                time_since_last_check = 0
+                self.time_since_last_check = 0
                 self.littering_agents.clear()
 
-            if self.method == 'Centralised-end' or (self.method == 'Hybrid' and random.random() >= self.b) :
+            if self.method == 'Centralised-end' or (self.method == 'Hybrid' and self.rng.random() >= self.b) :
                 for agent in self.agents:
                     if agent.has_littered_this_trip and agent.current_position == agent.end_position:
                         agent.sanctioned += 1
                         self.total_sanctions += 1
                         agent.has_littered_this_trip = False  # Reset flag
+            if inst is not None:
+                inst.lap('central_sanctions')
 
             # Step 6: Update internal state of agents
             for agent in self.agents:
                 agent.update_internal_state(self)
-                agents_data[agent.unique_id]['steps'].append(step)
-                agents_data[agent.unique_id]['comp_probs'].append(agent.compliant_prob)
-                agents_data[agent.unique_id]['sanctions'].append(agent.sanctioned)
-            
-            avg_compliance = sum(agent.compliant_prob for agent in self.agents) / len(self.agents)
-            self.compliance_over_time.append(avg_compliance)
-            self.clean_squares_record.append(self.count_clean_squares())
-            # self.save_results()
-
-            percentage_clean = self.compute_percentage_clean_cells()
-            self.cleanliness_over_time.append(percentage_clean)
-            self.total_sanctions_over_time.append(self.total_sanctions)
-
-#             # Event handling for Pygame
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    return
-
-            # Rendering
-            background = pygame.Surface(screen.get_size())
-            background = background.convert()
-            background.fill((255, 255, 255))
-            screen.blit(background, (0, 0))
-
-            for x in range(self.width):
-                for y in range(self.height):
-                    rect = pygame.Rect(x * cell_size, y * cell_size, cell_size, cell_size)
-                    pygame.draw.rect(screen, (200, 200, 200), rect, 1)
-
-                    if (x, y) in self.house_positions:
-                        screen.blit(self.house_img, rect)
-                    elif (x, y) in self.office_position:
-                        screen.blit(self.office_img, rect)
-                    elif (x, y) in self.park_positions:
-                        screen.blit(self.park_img, rect)
-                    elif (x, y) in self.trash_bins:
-                        screen.blit(self.trash_bin_img, rect)
-
-                    trash_count = self.get_trash_count((x, y))
-                    if trash_count > 0:
-                        font = pygame.font.Font(None, 36)
-                        text = font.render(str(trash_count), True, (0, 0, 0))
-                        screen.blit(text, (x * cell_size, y * cell_size))
-
-            for agent in self.agents:
-                x, y = agent.current_position
-                rect = pygame.Rect(x * self.cell_size, y * self.cell_size, self.cell_size, self.cell_size)
-                if agent.littering:
-                    screen.blit(self.agent_littering_img, rect)
-                # elif agent.punished:
-                #     screen.blit(self.agent_punished_img, rect)
-                elif agent.comp:
-                    screen.blit(self.agent_bin_img, rect)
-                else:
-                    screen.blit(self.agent_normal_img, rect)
-
-            pygame.display.flip()
-            clock.tick(1000)
-
-
-        all_agent_records = []
-        for agent_id, data in agents_data.items():
-            for step, comp_prob, sanction in zip(data['steps'], data['comp_probs'], data['sanctions']):
-                all_agent_records.append({
-                    'agent_id': agent_id,
-                    'step': step,
-                    'compliance_probability': comp_prob,
-                    'sanction_level': sanction
-                })
-
-        agents_df = pd.DataFrame(all_agent_records)
-       
-
-
-        pygame.quit()
+            if inst is not None:
+                inst.lap('update_internal_state')
+
+            compliance = [agent.compliant_prob for agent in self.agents]
+            avg_compliance = sum(compliance) / len(self.agents)
+            self.recorder.record(
+                compliance, [agent.sanctioned for agent in self.agents], avg_compliance,
+                self.count_clean_squares(), self.compute_percentage_clean_cells(), self.total_sanctions
+            )
+
+            self.steps_done = step + 1
+            if inst is not None:
+                inst.lap('metrics')
+
+            # Step 7: Notify observers; any of them may stop the run
+            keep_running = self.notify_observers()
+            if inst is not None:
+                inst.lap('observers')
+                inst.count('sanctions', self.total_sanctions - sanctions_before)
+                inst.counters['dead_agents'] = sum(agent.is_dead for agent in self.agents)
+                inst.end_step(step)
+            if not keep_running:
+                break
+
+        for observer in self.observers:
+            observer.on_end(self)
+
+    def __getstate__(self):
+        # Observers hold windows and other live resources, and the path fields are
+        # caches rebuilt on demand, so neither goes into a snapshot (nor does instrumentation)
+        state = self.__dict__.copy()
+        del state['trash_view']
+        state['observers'] = []
+        state['instrumentation'] = None
+        state['flow_fields'] = {}
+        state['trash_field'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.trash_view = self.trash.view()
+        self.trash_view.flags.writeable = False
+
+    def reseed(self, seed=None):
+        # New streams for the run and, with agent_streams, for every agent; seed may also be a SeedSequence
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        run_seed, agents_seed = self.seed_sequence.spawn(2)
+        self.rng = RandomStream(run_seed)
+        self.agents_seed = agents_seed if self.agent_streams else None
+        for agent in self.agents:
+            agent.rng = self.agent_rng(agent.unique_id)
+
+    def agent_rng(self, agent_id):
+        # Agent streams depend only on the seed and the agent's id
+        if self.agents_seed is None:
+            return self.rng
+        seed = np.random.SeedSequence(self.agents_seed.entropy, spawn_key=self.agents_seed.spawn_key + (agent_id,))
+        return RandomStream(seed, block_size=AGENT_BLOCK_SIZE)
+
+    def snapshot(self):
+        # Complete state between two steps; the random streams are part of it
+        return pickle.dumps({'env': self}, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def restore(cls, data, observers=None, restore_rng=True, seed=None):
+        # restore_rng=False gives the restored world fresh streams derived from seed instead of the saved ones
+        saved = pickle.loads(data)
+        env = saved['env']
+        env.observers = list(observers) if observers else []
+        if not restore_rng:
+            env.reseed(seed)
+        return env
+
+    def save_snapshot(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.snapshot())
+
+    @classmethod
+    def load_snapshot(cls, path, observers=None, restore_rng=True, seed=None):
+        with open(path, 'rb') as f:
+            return cls.restore(f.read(), observers=observers, restore_rng=restore_rng, seed=seed)
+
+    def fork(self, observers=None, seed=None, **overrides):
+        # Independent copy of this world, e.g. fork(method='Hybrid', b=0.3) to branch a
+        # scenario off a warmed-up run; the copy draws from fresh streams derived from seed,
+        # by default from this run's seed and the number of forks taken from it so far
+        if seed is None:
+            seed = self.seed_sequence.spawn(1)[0]
+        env = self.restore(self.snapshot(), observers=observers, restore_rng=False, seed=seed)
+        for name, value in overrides.items():
+            if not hasattr(env, name):
+                raise AttributeError(f"GridWorld has no attribute '{name}'")
+            setattr(env, name, value)
+        return env
+
+    def notify_observers(self):
+        keep_running = True
+        for observer in self.observers:
+            if observer.on_step(self) is False:
+                keep_running = False
+        return keep_running
 
     def apply_actions(self, actions):
         # dead_agents = [agent for agent in self.agents if getattr(agent, 'is_dead', False)]
@@ -207,50 +332,37 @@ class GridWorld:
 
         for agent in self.agents:
             agent.was_sanctioned = False
-            # Update agent positions
-        for agent_id, action in actions.items():
-            move_pos = action.get('move')
-
-            if move_pos is None:
-                move_pos = self.agents[agent_id].current_position  # Agent stays in place
-            elif not self.is_passable(move_pos):
-                # Cannot move into impassable cell, stay in place
-                move_pos = self.agents[agent_id].current_position
-            # Update agent position
-            self.agents[agent_id].current_position = move_pos
-
-        # First, collect proposed moves
-        proposed_moves = {}
-        destination_counts = defaultdict(list)
-        for agent_id, action in actions.items():
-            move_pos = action.get('move')
-            if move_pos is None:
-                move_pos = self.agents[agent_id].current_position  # Agent stays in place
-            elif not self.is_passable(move_pos):
-                # Cannot move into impassable cell, stay in place
-                move_pos = self.agents[agent_id].current_position
-            proposed_moves[agent_id] = move_pos
-            destination_counts[move_pos].append(agent_id)
-
-        # Resolve conflicts
-        final_positions = {}
-        for agent_id, move_pos in proposed_moves.items():
-            if len(destination_counts[move_pos]) > 1:
-                # Conflict: agents stay in place
-                final_positions[agent_id] = self.agents[agent_id].current_position
-            else:
-                final_positions[agent_id] = move_pos
-
-        # Update agent positions
-        for agent_id, new_pos in final_positions.items():
-            self.agents[agent_id].current_position = new_pos
-
-        # Process actions at positions
+
+        # Proposed moves, one row per acting agent; no move or an impassable target means staying put
+        agent_ids = list(actions)
+        current_positions = [self.agents[agent_id].current_position for agent_id in agent_ids]
+        moves = [action.get('move') for action in actions.values()]
+        current = np.array(current_positions, dtype=np.intp).reshape(-1, 2)
+        proposed = np.array([position if move is None else move for position, move in zip(current_positions, moves)], dtype=np.intp).reshape(-1, 2)
+        blocked = ~self.passable[proposed[:, 0], proposed[:, 1]]
+        proposed[blocked] = current[blocked]
+
+        # Agents proposing the same cell. Positions used to be committed before this
+        # check, so "staying in place" kept them on the shared cell; that outcome is
+        # kept and the collisions are only counted.
+        _, inverse, counts = np.unique(proposed[:, 0] * self.height + proposed[:, 1], return_inverse=True, return_counts=True)
+        self.move_conflicts = int(np.count_nonzero(counts[inverse] > 1))
+        if self.instrumentation is not None:
+            self.instrumentation.count('move_conflicts', self.move_conflicts)
+
+        # Commit every position once; an agent that changes cell took its requested move
+        for i in np.flatnonzero((proposed != current).any(axis=1)).tolist():
+            self.move_agent(self.agents[agent_ids[i]], moves[i])
+
+        # Process actions at positions, indexing litterers by cell and sanctions by target
+        litterers_by_cell = defaultdict(list)
+        sanctions_by_target = defaultdict(list)
         for agent_id, action in actions.items():
             action_type = action.get('action')
             if action_type == 'litter':
                 position = self.agents[agent_id].current_position
                 self.add_trash(position)
+                litterers_by_cell[position].append(agent_id)
                 if self.method == 'Centralised-ts':
                     self.littering_agents.add(agent_id)
                 
@@ -278,44 +390,110 @@ class GridWorld:
                     if target_agent_id is not None:
                         self.agents[target_agent_id].was_sanctioned = True
                         self.total_sanctions += 1
+                        sanctions_by_target[target_agent_id].append(agent_id)
 
+        return {'litterers_by_cell': litterers_by_cell, 'sanctions_by_target': sanctions_by_target}
 
 
-    def load_images(self):
-        self.house_img = pygame.image.load("icons/house.png")
-        self.house_img = pygame.transform.scale(self.house_img, (self.cell_size, self.cell_size))
-        self.office_img = pygame.image.load("icons/office.png")
-        self.office_img = pygame.transform.scale(self.office_img, (self.cell_size, self.cell_size))
-        self.park_img = pygame.image.load("icons/004-park.png")
-        self.park_img = pygame.transform.scale(self.park_img, (self.cell_size, self.cell_size))
-        self.trash_bin_img = pygame.image.load("icons/bin.png")
-        self.trash_bin_img = pygame.transform.scale(self.trash_bin_img, (self.cell_size, self.cell_size))
-        self.agent_littering_img = pygame.image.load("icons/redman.png")
-        self.agent_littering_img = pygame.transform.scale(self.agent_littering_img, (self.cell_size, self.cell_size))
-        self.agent_punished_img = pygame.image.load("icons/Sanction List.png")
-        self.agent_punished_img = pygame.transform.scale(self.agent_punished_img, (self.cell_size, self.cell_size))
-        self.agent_bin_img = pygame.image.load("icons/blueman.png")
-        self.agent_bin_img = pygame.transform.scale(self.agent_bin_img, (self.cell_size, self.cell_size))
-        self.agent_normal_img = pygame.image.load("icons/blackman.png")
-        self.agent_normal_img = pygame.transform.scale(self.agent_normal_img, (self.cell_size, self.cell_size))
 
     def is_passable(self, position):
-        trash_count = self.get_trash_count(position)
-        if position in self.trash_bins:
-            return True
-        else:
-            return trash_count <= 3
-
+        return bool(self.passable[position])
 
     def get_trash_count(self, position):
-        return self.trash[position]
+        return int(self.trash[position])
 
     def add_trash(self, position):
+        if self.trash[position] == 0:
+            self.clean_cells -= 1
+            self.trash_field = None
         self.trash[position] += 1
+        if self.trash[position] == MAX_PASSABLE_TRASH + 1 and position not in self.trash_bins:
+            self.passable[position] = False
+            self.flow_fields.clear()
+            self.trash_field = None
 
     def remove_trash(self, position):
         if self.trash[position] > 0:
             self.trash[position] -= 1
+            if self.trash[position] == 0:
+                self.clean_cells += 1
+                self.trash_field = None
+            if self.trash[position] == MAX_PASSABLE_TRASH and not self.passable[position]:
+                self.passable[position] = True
+                self.flow_fields.clear()
+                self.trash_field = None
+
+    def has_trash(self):
+        return self.clean_cells < self.width * self.height
+
+    def get_flow_field(self, goal):
+        field = self.flow_fields.get(goal)
+        if field is None:
+            sources = np.zeros_like(self.passable)
+            sources[goal] = True
+            field = self.compute_distance_field(sources)
+            self.flow_fields[goal] = field
+            if self.instrumentation is not None:
+                self.instrumentation.count('goal_fields_built')
+        return field
+
+    def get_trash_field(self):
+        if self.trash_field is None:
+            self.trash_field = self.compute_distance_field(self.trash > 0)
+            if self.instrumentation is not None:
+                self.instrumentation.count('trash_fields_built')
+        return self.trash_field
+
+    def compute_distance_field(self, sources):
+        # Breadth-first distance to the nearest passable source cell, one layer per iteration; -1 = unreachable
+        field = np.full((self.width, self.height), -1, dtype=np.int32)
+        reached = sources & self.passable
+        field[reached] = 0
+        frontier = reached.copy()
+        distance = 0
+        while frontier.any():
+            distance += 1
+            grown = np.zeros_like(frontier)
+            grown[1:, :] |= frontier[:-1, :]
+            grown[:-1, :] |= frontier[1:, :]
+            grown[:, 1:] |= frontier[:, :-1]
+            grown[:, :-1] |= frontier[:, 1:]
+            frontier = grown & self.passable & ~reached
+            reached |= frontier
+            field[frontier] = distance
+        if self.instrumentation is not None:
+            self.instrumentation.count('cells_expanded', int(reached.sum()))
+        return field
+
+    def get_path(self, start, goal):
+        # Like the old A* the path starts with start itself
+        if self.instrumentation is not None:
+            self.instrumentation.count('path_queries')
+        if start == goal:
+            return [start]
+        return self.follow_field(start, self.get_flow_field(goal))
+
+    def get_path_to_nearest_trash(self, start):
+        if self.instrumentation is not None:
+            self.instrumentation.count('trash_path_queries')
+        return self.follow_field(start, self.get_trash_field())
+
+    def follow_field(self, start, field):
+        # Walk downhill from start until a cell at distance 0; [] if none is reachable
+        if field[start] == 0:
+            return [start]
+        steps = [(next, field[next]) for next in self.get_neighborhood(start) if field[next] >= 0]
+        if not steps:
+            return []
+        distance = min(d for _, d in steps)
+        path = [start]
+        while distance >= 0:
+            # Ties between equally short routes are broken at random, as A* did
+            current = self.rng.choice([next for next, d in steps if d == distance])
+            path.append(current)
+            distance -= 1
+            steps = [(next, field[next]) for next in self.get_neighborhood(current)]
+        return path
 
     def get_neighborhood(self, position):
         x, y = position
@@ -326,13 +504,7 @@ class GridWorld:
         return {agent.unique_id: agent.current_position for agent in self.agents}
 
     def count_clean_squares(self):
-        clean_count = 0
-        for x in range(self.width):
-            for y in range(self.height):
-                position = (x, y)
-                if self.get_trash_count(position) == 0:
-                    clean_count += 1
-        return clean_count
+        return self.clean_cells
 
     def save_trip_steps(self, agent_id, trip_id):
         self.trip_steps.append([self.method, self.step_id, agent_id, trip_id])
@@ -0,0 +1,70 @@
+import cProfile
+import os
+import time
+from collections import defaultdict
+
+
+class Instrumentation:
+    """Opt-in timers, counters and profiler hook for GridWorld.run_env.
+
+    Pass one as GridWorld(..., instrumentation=Instrumentation()). run_env
+    charges the time between two laps to the named phase; path finding and
+    agents add to the counters. Steps listed in profile_steps run under a
+    fresh profiler from profiler_factory (cProfile by default, or anything
+    with enable()/disable()), kept in profiles and dumped to profile_dir.
+    """
+
+    def __init__(self, profile_steps=(), profiler_factory=cProfile.Profile, profile_dir=None):
+        self.phase_seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.steps = 0
+        self.profile_steps = set(profile_steps)
+        self.profiler_factory = profiler_factory
+        self.profile_dir = profile_dir
+        self.profiles = {}
+        self.profiler = None
+        self.last_lap = None
+
+    def begin_step(self, step):
+        if step in self.profile_steps:
+            self.profiler = self.profiler_factory()
+            self.profiler.enable()
+        self.last_lap = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phase_seconds[phase] += now - self.last_lap
+        self.last_lap = now
+
+    def end_step(self, step):
+        self.steps += 1
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiles[step] = self.profiler
+            if self.profile_dir is not None and hasattr(self.profiler, 'dump_stats'):
+                if not os.path.exists(self.profile_dir):
+                    os.makedirs(self.profile_dir)
+                self.profiler.dump_stats(os.path.join(self.profile_dir, f'step_{step}.prof'))
+            self.profiler = None
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def summary(self):
+        total = sum(self.phase_seconds.values())
+        return {
+            'steps': self.steps,
+            'total_seconds': total,
+            'phase_seconds': dict(self.phase_seconds),
+            'phase_share': {phase: seconds / total for phase, seconds in self.phase_seconds.items()} if total else {},
+            'counters': dict(self.counters),
+        }
+
+    def report(self):
+        summary = self.summary()
+        lines = [f'{summary["steps"]} steps in {summary["total_seconds"]:.3f} s']
+        for phase, seconds in sorted(self.phase_seconds.items(), key=lambda item: -item[1]):
+            lines.append(f'  {phase:<24} {seconds:9.3f} s  {summary["phase_share"][phase]:6.1%}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'  {name:<24} {value:9d}')
+        return '\n'.join(lines)
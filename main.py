@@ -3,11 +3,139 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from scipy import stats
+from concurrent.futures import ProcessPoolExecutor
 from agent import CleaningAgent
 from env import GridWorld
+from vector_env import VectorGridWorld
 from utils import initial_map
+from sweep_config import world_sizes, agent_densities, run_seed
+from scenarios import Scenario, ScenarioStore
+from result_store import ResultStore
+from stopping import ConvergenceStop
+from trajectory_log import TrajectoryLogger
 import os
 
+
+methods = ["Centralised-end", "Decentralised", "Hybrid"]
+
+
+def pad_series(series, length):
+    # Runs that stopped early have flatlined, so their last value stands for the remaining steps
+    series = np.asarray(series)
+    if len(series) >= length:
+        return series[:length]
+    return np.concatenate([series, np.full(length - len(series), series[-1])])
+
+
+def replicates_needed(values, ci_width, confidence, max_runs):
+    # Runs needed for the confidence interval on the mean of values to be at most ci_width wide
+    n = len(values)
+    if n >= max_runs:
+        return n
+    t_quantile = stats.t.ppf((1 + confidence) / 2, n - 1)
+    sd = np.std(values, ddof=1)
+    if 2 * t_quantile * sd / np.sqrt(n) <= ci_width:
+        return n
+    # Solve 2 * t * sd / sqrt(n) = ci_width for n with the current estimates
+    return int(min(max_runs, max(n + 1, np.ceil((2 * t_quantile * sd / ci_width) ** 2))))
+
+
+def simulate(job):
+    print(f'Running {job["method"]} for run {job["run"] + 1} with {job["num_agents"]} agents in {job["world_size"]} world ({job["width"]}x{job["height"]}), {job["density"]} density')
+
+    # Stored scenarios are memory-mapped, so every worker shares the precomputed tables
+    scenario = Scenario(job['scenario_path']) if job['scenario_path'] is not None else None
+    house_positions, office_positions, park_positions, trash_bins = job['layout']
+    observers = list(job['observers'] or [])
+    if job['early_stop'] is not None:
+        observers.append(ConvergenceStop(**job['early_stop']))
+    if job['event_log_dir'] is not None and job['engine'] == 'scalar':
+        observers.append(TrajectoryLogger(os.path.join(job['event_log_dir'], f'{job["world_size"]}_{job["density"]}_{job["method"]}_run{job["run"] + 1}.log')))
+    if job['engine'] == 'vector':
+        env = VectorGridWorld(
+            job['width'], job['height'], job['num_agents'], job['method'], job['b'],
+            job['initial_compliant_probs'], house_positions,
+            office_positions, park_positions, trash_bins,
+            job['run'], job['t'], job['w'],
+            seed=job['seed'], observers=observers, scenario=scenario
+        )
+    else:
+        env = GridWorld(
+            job['width'], job['height'], job['num_agents'], job['method'], job['b'],
+            job['initial_compliant_probs'], house_positions,
+            office_positions, park_positions, trash_bins,
+            job['run'], job['t'], job['w'],
+            observers=observers, scenario=scenario, seed=job['seed']
+        )
+    env.run_env(job['steps'])
+
+    # Keep the per-agent trajectories of the run as a compressed npz file
+    if job['trajectory_dir'] is not None:
+        env.recorder.save(os.path.join(job['trajectory_dir'], f'{job["world_size"]}_{job["density"]}_{job["method"]}_run{job["run"] + 1}.npz'))
+
+    # Collect final compliance probabilities
+    if job['engine'] == 'vector':
+        final_compliant_probs = env.compliant_prob
+        sanctions_received = env.sanctioned
+    else:
+        final_compliant_probs = [agent.compliant_prob for agent in env.agents]
+        sanctions_received = [agent.sanctioned for agent in env.agents]
+    average_compliance = sum(final_compliant_probs) / len(final_compliant_probs)
+
+    if env.num_agents > 0:
+        total_sanctions_received = sum(sanctions_received)
+        average_sanctions_per_agent = total_sanctions_received / len(final_compliant_probs)
+    else:
+        average_sanctions_per_agent = 0  # No agents left
+
+    result = {
+        'average_compliance': average_compliance,
+        'average_sanctions_per_agent': average_sanctions_per_agent,
+        'compliance_over_time': env.get_average_compliance_over_time(),
+        'cleanliness_over_time': env.cleanliness_over_time,
+        'sanctions_over_time': env.total_sanctions_over_time,
+        'stop_step': env.stop_step,
+    }
+    # Workers append their own runs to the shared store
+    if job['result_store'] is not None:
+        ResultStore(job['result_store']).append(job['world_size'], job['density'], job['method'], job['run'], result)
+    return result
+
+
+def simulate_lockstep(job):
+    # All runs in job['runs'] as replicas of one VectorGridWorld stepped together; one result per run
+    print(f'Running {job["method"]} for runs {job["runs"][0] + 1}-{job["runs"][-1] + 1} in lockstep with {job["num_agents"]} agents in {job["world_size"]} world ({job["width"]}x{job["height"]}), {job["density"]} density')
+    scenario = Scenario(job['scenario_path']) if job['scenario_path'] is not None else None
+    house_positions, office_positions, park_positions, trash_bins = job['layout']
+    env = VectorGridWorld(
+        job['width'], job['height'], job['num_agents'], job['method'], job['b'],
+        job['initial_compliant_probs'], house_positions,
+        office_positions, park_positions, trash_bins,
+        job['runs'][0], job['t'], job['w'],
+        seed=job['seed'], replicas=len(job['runs']), scenario=scenario
+    )
+    env.run_env(job['steps'])
+
+    results = []
+    store = ResultStore(job['result_store']) if job['result_store'] is not None else None
+    for run, recorder in zip(job['runs'], env.recorders):
+        if job['trajectory_dir'] is not None:
+            recorder.save(os.path.join(job['trajectory_dir'], f'{job["world_size"]}_{job["density"]}_{job["method"]}_run{run + 1}.npz'))
+        final_compliant_probs = recorder.series('compliance')[-1]
+        results.append({
+            'average_compliance': final_compliant_probs.mean(),
+            'average_sanctions_per_agent': recorder.series('sanctions')[-1].mean() if env.num_agents > 0 else 0,
+            'compliance_over_time': recorder.series('average_compliance'),
+            'cleanliness_over_time': recorder.series('cleanliness'),
+            'sanctions_over_time': recorder.series('total_sanctions'),
+            'stop_step': None,
+        })
+        if store is not None:
+            store.append(job['world_size'], job['density'], job['method'], run, results[-1])
+    return results
+
+
 if __name__ == "__main__":
     seed = 0
     np.random.seed(seed)
@@ -17,25 +145,35 @@ if __name__ == "__main__":
     b = 0.5 #sanctioning rate[0.1,0.3,0.5,0.7,0.9]
     t = 10
     num_runs = 10
+    adaptive_runs = False # keep adding runs per configuration until the CI on final average_compliance is narrow enough
+    ci_width = 0.02 # target full width of that confidence interval
+    confidence = 0.95
+    min_runs = 5 # runs per configuration before the first check; num_runs is ignored in adaptive mode
+    max_runs = 50 # run budget per configuration
     w = 1 #observation zone [0,1,2 ...]
+    render = False # draw every step with pygame; sweeps run headless
+    num_workers = os.cpu_count() # processes for the sweep; 1 runs everything in this process
+    engine = 'scalar' # 'scalar' (GridWorld), 'vector' (VectorGridWorld, for large populations) or 'lockstep' (each configuration's runs as replicas of one VectorGridWorld; early_stop does not apply)
+    early_stop = None # e.g. {'window': 50, 'norm_level': 0.9} to end converged runs early (stopping.ConvergenceStop)
+    scenario_dir = 'scenarios' # maps and their static tables are generated once and stored here (scenarios.ScenarioStore); None builds them per run
+    result_store = 'results/store' # append-only binary store of every run's series (result_store.ResultStore) read by test.py and plot.py; None writes per-configuration CSVs instead
+    trajectory_dir = None # folder for per-run npz trajectories (recorder.MetricsRecorder); None keeps only the CSV summaries
+    event_log_dir = None # folder for per-run binary event logs (trajectory_log.TrajectoryLogger, scalar engine only) to render later with replay.py
 
-    methods = ["Centralised-end", "Decentralised", "Hybrid"]
-    world_sizes = {
-        'Small': (20, 20),
-         'Large': (40, 40)
-    }
-    agent_densities = {
-        'Sparse': {'Small': 3, 'Large': 12},
-        # 'Sparse': {'Small': 5, 'Large': 50},
-        'Natural': {'Small': 10, 'Large': 40},
-        # 'Dense': {'Small': 20, 'Large': 500},
-        'Dense': {'Small': 30, 'Large': 120}
-    }
+    if render:
+        from render import PygameRenderer
+        num_workers = 1
 
-    # List to store results
-    final_compliance_results = []
+    if trajectory_dir is not None and not os.path.exists(trajectory_dir):
+        os.makedirs(trajectory_dir)
+    if event_log_dir is not None and not os.path.exists(event_log_dir):
+        os.makedirs(event_log_dir)
+
+    if result_store is not None:
+        ResultStore.create(result_store, steps, overwrite=True)
 
-    # Iterate over world sizes and agent densities
+    # One configuration per (world size, density, method), in the order of the serial sweep
+    configs = []
     for world_size_name, (width, height) in world_sizes.items():
         for density_name, agent_nums in agent_densities.items():
             num_agents = agent_nums[world_size_name]
@@ -44,76 +182,125 @@ if __name__ == "__main__":
             initial_compliant_probs = [0.5 for _ in range(num_agents)]
 
             # Generate environment positions based on the world size
-            house_positions, office_positions, park_positions, trash_bins = initial_map(num_agents, width, height)
-
+            if scenario_dir is not None:
+                scenario = ScenarioStore(scenario_dir).get(num_agents, width, height)
+                layout, scenario_path = scenario.layout, scenario.path
+            else:
+                layout, scenario_path = initial_map(num_agents, width, height), None
 
             for method in methods:
-                # Prepare to collect results for boxplots and time series
-                compliance_over_time_runs = []
-                cleanliness_over_time_runs = []
-                sanctions_over_time_runs = []
-
-                for run in range(num_runs):
-                    print(f'Running {method} for run {run + 1} with {num_agents} agents in {world_size_name} world ({width}x{height}), {density_name} density')
-
-                    env = GridWorld(
-                        width, height, num_agents, method, b,
-                        initial_compliant_probs, house_positions,
-                        office_positions, park_positions, trash_bins,
-                        run, t,w
-                    )
-                    env.run_env(steps)
-
-                    # Collect final compliance probabilities
-                    final_compliant_probs = [agent.compliant_prob for agent in env.agents]
-                    average_compliance = sum(final_compliant_probs) / len(final_compliant_probs)
-
-                    if env.num_agents > 0:
-                        total_sanctions_received = sum(agent.sanctioned for agent in env.agents)
-                        average_sanctions_per_agent = total_sanctions_received / len(env.agents)
-                    else:
-                        average_sanctions_per_agent = 0  # No agents left
-
-                    # Save final average compliance for boxplots
-                    final_compliance_results.append({
-                        'world_size': world_size_name,
-                        'density': density_name,
-                        'method': method,
-                        'run': run + 1,
-                        'average_compliance': average_compliance,
-                        'average_sanctions_per_agent': average_sanctions_per_agent,
-                        # 'agents_remaining': env.num_agents,
-                        # 'agents_removed': env.dead_agents_count
-                    })
-
-                    # Collect compliance over time for this run
-                    compliance_over_time = env.get_average_compliance_over_time()
-                    compliance_over_time_runs.append(compliance_over_time)
-
-                    cleanliness_over_time = env.cleanliness_over_time
-                    cleanliness_over_time_runs.append(cleanliness_over_time)
-
-                    sanctions_over_time = env.total_sanctions_over_time
-                    sanctions_over_time_runs.append(sanctions_over_time)
-
-                # After all runs for this method, save the compliance over time data
-                # Average over the runs
-                avg_compliance_over_time = np.mean(compliance_over_time_runs, axis=0)
-                avg_cleanliness_over_time = np.mean(cleanliness_over_time_runs, axis=0)
-                avg_sanctions_over_time = np.mean(sanctions_over_time_runs, axis=0)
-
-
-                # Save the time series data to CSV
-                folder_name = f'results/{world_size_name}_{density_name}_{method}'
-                if not os.path.exists(folder_name):
-                    os.makedirs(folder_name)
-                time_series_df = pd.DataFrame({
-                    'time_step': np.arange(len(avg_compliance_over_time)),
-                    'average_compliance': avg_compliance_over_time,
-                    'average_cleanliness': avg_cleanliness_over_time,
-                    'average_sanctions': avg_sanctions_over_time
+                configs.append({
+                    'world_size': world_size_name,
+                    'density': density_name,
+                    'method': method,
+                    'width': width,
+                    'height': height,
+                    'num_agents': num_agents,
+                    'initial_compliant_probs': initial_compliant_probs,
+                    'layout': layout,
+                    'scenario_path': scenario_path,
+                    'steps': steps,
+                    'b': b,
+                    't': t,
+                    'w': w,
+                    'engine': engine,
+                    'trajectory_dir': trajectory_dir,
+                    'event_log_dir': event_log_dir,
+                    'result_store': result_store,
+                    'early_stop': early_stop,
                 })
-                time_series_df.to_csv(f'{folder_name}/3smallaverage_compliance_over_time.csv', index=False)
+
+    def config_key(job):
+        return (job['world_size'], job['density'], job['method'])
+
+    # Runs are submitted in rounds. A fixed sweep is a single round of num_runs per
+    # configuration; in adaptive mode every round tops up the configurations whose
+    # confidence interval is still too wide.
+    executor = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 else None
+    runs_wanted = {config_key(config): min_runs if adaptive_runs else num_runs for config in configs}
+    runs_done = {config_key(config): 0 for config in configs}
+    final_compliance = {config_key(config): [] for config in configs}
+    jobs, results = [], []
+    while True:
+        round_jobs = []
+        lockstep_jobs = []
+        for config in configs:
+            key = config_key(config)
+            runs = list(range(runs_done[key], runs_wanted[key]))
+            if engine == 'lockstep' and runs:
+                lockstep_jobs.append(dict(config, runs=runs, seed=run_seed(seed, *key, runs[0])))
+                round_jobs.extend(dict(config, run=run) for run in runs)
+            else:
+                for run in runs:
+                    round_jobs.append(dict(config, run=run, seed=run_seed(seed, *key, run), observers=[PygameRenderer()] if render else None))
+            runs_done[key] = runs_wanted[key]
+        if not round_jobs:
+            break
+
+        round_simulate, round_inputs = (simulate_lockstep, lockstep_jobs) if engine == 'lockstep' else (simulate, round_jobs)
+        if executor is not None:
+            # map yields results in submission order whatever order the runs finish in
+            round_results = list(executor.map(round_simulate, round_inputs))
+        else:
+            round_results = [round_simulate(job) for job in round_inputs]
+        if engine == 'lockstep':
+            # One list of per-run results per configuration, in the order of round_jobs
+            round_results = [result for results_of_config in round_results for result in results_of_config]
+        for job, result in zip(round_jobs, round_results):
+            final_compliance[config_key(job)].append(result['average_compliance'])
+        jobs.extend(round_jobs)
+        results.extend(round_results)
+
+        if not adaptive_runs:
+            break
+        for key, values in final_compliance.items():
+            runs_wanted[key] = replicates_needed(values, ci_width, confidence, max_runs)
+        print(f'Runs per configuration after this round: {runs_wanted}')
+    if executor is not None:
+        executor.shutdown()
+
+    # Back to sweep order: configuration, then run
+    config_order = {config_key(config): i for i, config in enumerate(configs)}
+    jobs, results = zip(*sorted(zip(jobs, results), key=lambda pair: (config_order[config_key(pair[0])], pair[0]['run'])))
+
+    # List to store results
+    final_compliance_results = []
+    runs_by_config = {}
+
+    for job, result in zip(jobs, results):
+        # Save final average compliance for boxplots
+        final_compliance_results.append({
+            'world_size': job['world_size'],
+            'density': job['density'],
+            'method': job['method'],
+            'run': job['run'] + 1,
+            'average_compliance': result['average_compliance'],
+            'average_sanctions_per_agent': result['average_sanctions_per_agent'],
+            'stop_step': result['stop_step'],
+            # 'agents_remaining': env.num_agents,
+            # 'agents_removed': env.dead_agents_count
+        })
+        runs_by_config.setdefault((job['world_size'], job['density'], job['method']), []).append(result)
+
+    # Without a result store, keep the per-configuration CSV time series
+    if result_store is None:
+        for (world_size_name, density_name, method), runs in runs_by_config.items():
+            # Average the time series over the runs, extending early-stopped ones to the full length
+            avg_compliance_over_time = np.mean([pad_series(run['compliance_over_time'], steps) for run in runs], axis=0)
+            avg_cleanliness_over_time = np.mean([pad_series(run['cleanliness_over_time'], steps) for run in runs], axis=0)
+            avg_sanctions_over_time = np.mean([pad_series(run['sanctions_over_time'], steps) for run in runs], axis=0)
+
+            # Save the time series data to CSV
+            folder_name = f'results/{world_size_name}_{density_name}_{method}'
+            if not os.path.exists(folder_name):
+                os.makedirs(folder_name)
+            time_series_df = pd.DataFrame({
+                'time_step': np.arange(len(avg_compliance_over_time)),
+                'average_compliance': avg_compliance_over_time,
+                'average_cleanliness': avg_cleanliness_over_time,
+                'average_sanctions': avg_sanctions_over_time
+            })
+            time_series_df.to_csv(f'{folder_name}/3smallaverage_compliance_over_time.csv', index=False)
 
     # Save final compliance results to CSV for boxplots
     final_compliance_df = pd.DataFrame(final_compliance_results)
@@ -2,6 +2,7 @@ import matplotlib.pyplot as plt
 import pandas as pd
 # import wandb  # Commented out for standalone execution
 import seaborn as sns
+from result_store import ResultStore
 
 def plot_average_compliance_vs_num_agents(results_df):
     results_df['method_b'] = results_df.apply(
@@ -106,3 +107,20 @@ def plot_average_trip_duration(results_df):
     plt.show()
 
 
+
+def plot_time_series_from_store(store_path='results/store', series='compliance'):
+    # Mean and spread over runs of one series for every configuration in a result_store.ResultStore
+    store = ResultStore(store_path)
+    plt.figure(figsize=(12, 8))
+    for world_size, density, method in store.configurations():
+        runs = store.series(series, world_size, density, method)
+        mean = runs.mean(axis=0)
+        sd = runs.std(axis=0)
+        line, = plt.plot(mean, label=f'{world_size} {density} {method}')
+        plt.fill_between(range(len(mean)), mean - sd, mean + sd, color=line.get_color(), alpha=0.15)
+    plt.xlabel('Time Step')
+    plt.ylabel(series.capitalize())
+    plt.title(f'{series.capitalize()} over Time by Configuration')
+    plt.legend(fontsize='small', ncol=2)
+    plt.savefig(f'results/4{series}_over_time.png')
+    plt.show()
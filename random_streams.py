@@ -0,0 +1,28 @@
+import numpy as np
+
+
+class RandomStream:
+    """Uniform draws from a NumPy Generator, pre-drawn a block at a time.
+
+    random() and choice() stand in for the random module's functions. Each
+    Generator call draws block_size numbers, which are then handed out one
+    by one, so a draw costs a list lookup. The stream pickles with its
+    position in the block, so a snapshot continues with the same draws.
+    """
+
+    def __init__(self, seed=None, block_size=4096):
+        self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+        self.block = []
+        self.index = 0
+
+    def random(self):
+        if self.index == len(self.block):
+            self.block = self.generator.random(self.block_size).tolist()
+            self.index = 0
+        value = self.block[self.index]
+        self.index += 1
+        return value
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
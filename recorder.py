@@ -0,0 +1,62 @@
+import numpy as np
+
+
+class MetricsRecorder:
+    """Per-step metrics of a run kept in preallocated NumPy arrays.
+
+    Per-agent trajectories are (steps x agents) arrays and the run-level
+    series are 1-D arrays; rows past `length` are unused capacity.
+    """
+
+    SERIES = ('average_compliance', 'clean_squares', 'cleanliness', 'total_sanctions')
+
+    def __init__(self, num_agents, capacity=0):
+        self.num_agents = num_agents
+        self.length = 0
+        self.compliance = np.zeros((capacity, num_agents), dtype=np.float64)
+        self.sanctions = np.zeros((capacity, num_agents), dtype=np.int64)
+        self.average_compliance = np.zeros(capacity, dtype=np.float64)
+        self.clean_squares = np.zeros(capacity, dtype=np.int64)
+        self.cleanliness = np.zeros(capacity, dtype=np.float64)
+        self.total_sanctions = np.zeros(capacity, dtype=np.int64)
+
+    def reserve(self, steps):
+        # Grow every array so that `steps` more rows fit without reallocating
+        needed = self.length + steps
+        capacity = len(self.average_compliance)
+        if needed <= capacity:
+            return
+        for name in ('compliance', 'sanctions') + self.SERIES:
+            old = getattr(self, name)
+            new = np.zeros((needed,) + old.shape[1:], dtype=old.dtype)
+            new[:self.length] = old[:self.length]
+            setattr(self, name, new)
+
+    def record(self, compliance, sanctions, average_compliance, clean_squares, cleanliness, total_sanctions):
+        if self.length == len(self.average_compliance):
+            self.reserve(max(self.length, 1))
+        row = self.length
+        self.compliance[row] = compliance
+        self.sanctions[row] = sanctions
+        self.average_compliance[row] = average_compliance
+        self.clean_squares[row] = clean_squares
+        self.cleanliness[row] = cleanliness
+        self.total_sanctions[row] = total_sanctions
+        self.length += 1
+
+    def series(self, name):
+        # View of the recorded part of a series or trajectory array
+        return getattr(self, name)[:self.length]
+
+    def save(self, path):
+        arrays = {name: self.series(name) for name in ('compliance', 'sanctions') + self.SERIES}
+        np.savez_compressed(path, step=np.arange(self.length), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            recorder = cls(data['compliance'].shape[1])
+            for name in ('compliance', 'sanctions') + cls.SERIES:
+                setattr(recorder, name, data[name])
+            recorder.length = len(data['step'])
+        return recorder
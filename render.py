@@ -0,0 +1,148 @@
+import numpy as np
+import pygame
+
+# Agent glyphs, in the order they are tested
+LITTERING = 0
+COMPLIANT = 1
+NORMAL = 2
+
+
+class PygameRenderer:
+    """Observer that draws a GridWorld (or replica 0 of a VectorGridWorld, or a replayed log) with pygame.
+
+    The static map (grid lines, houses, offices, parks and bins) is drawn
+    once into a background surface. Each frame only the cells whose trash
+    count or agents changed since the last drawn frame are restored from the
+    background and redrawn, and only their rectangles are pushed to the
+    display. Trash counts are drawn from cached glyphs. With frame_skip=n
+    only every n-th step is drawn; window events are handled every step.
+    """
+
+    def __init__(self, cell_size=30, fps=1000, frame_skip=1):
+        if frame_skip < 1:
+            raise ValueError(f'frame_skip must be at least 1, got {frame_skip}')
+        self.cell_size = cell_size
+        self.fps = fps
+        self.frame_skip = frame_skip
+        self.screen = None
+        self.clock = None
+        self.background = None
+        self.font = None
+        self.glyphs = {}
+        self.drawn = {}
+        self.steps = 0
+
+    def on_start(self, env):
+        pygame.init()
+        self.screen = pygame.display.set_mode((env.width * self.cell_size, env.height * self.cell_size))
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.Font(None, 36)
+        self.load_images()
+        self.background = self.draw_background(env)
+        self.screen.blit(self.background, (0, 0))
+        pygame.display.flip()
+        self.drawn = {}
+        self.steps = 0
+
+    def on_step(self, env):
+        # Event handling for Pygame
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+
+        self.steps += 1
+        if self.steps % self.frame_skip:
+            return True
+
+        pygame.display.update(self.draw(env))
+        self.clock.tick(self.fps)
+        return True
+
+    def draw(self, env):
+        # Redraw the cells that changed since the last call and return their rectangles
+        cells = self.cell_states(env)
+        dirty = [cell for cell in set(cells) | set(self.drawn) if cells.get(cell) != self.drawn.get(cell)]
+        rects = [self.draw_cell(cell, cells.get(cell)) for cell in dirty]
+        self.drawn = cells
+        return rects
+
+    def on_end(self, env):
+        pygame.quit()
+
+    def draw_background(self, env):
+        background = pygame.Surface(self.screen.get_size()).convert()
+        background.fill((255, 255, 255))
+        for x in range(env.width):
+            for y in range(env.height):
+                pygame.draw.rect(background, (200, 200, 200), self.rect((x, y)), 1)
+
+        # Houses win over offices, parks and bins on a shared cell, then offices, then parks
+        icons = {}
+        for positions, image in ((env.trash_bins, self.trash_bin_img), (env.park_positions, self.park_img),
+                                 (env.office_position, self.office_img), (env.house_positions, self.house_img)):
+            for position in positions:
+                icons[tuple(position)] = image
+        for position, image in icons.items():
+            background.blit(image, self.rect(position))
+        return background
+
+    def cell_states(self, env):
+        # (trash count, agent glyphs in drawing order) of every cell with trash or agents
+        if hasattr(env, 'agents'):
+            trash = env.trash
+            agents = [(agent.current_position, LITTERING if agent.littering else COMPLIANT if agent.comp else NORMAL) for agent in env.agents]
+        else:
+            trash = env.trash[:env.num_cells].reshape(env.width, env.height)
+            count = env.num_agents
+            glyph = np.where(env.littered[:count], LITTERING, np.where(env.comp[:count], COMPLIANT, NORMAL))
+            x, y = np.divmod(env.position[:count], env.height)
+            agents = [((cx, cy), g) for cx, cy, g in zip(x.tolist(), y.tolist(), glyph.tolist())]
+
+        states = {}
+        xs, ys = np.nonzero(trash)
+        for x, y, value in zip(xs.tolist(), ys.tolist(), trash[xs, ys].tolist()):
+            states[(x, y)] = (value, ())
+        for position, glyph in agents:
+            position = tuple(position)
+            value, glyphs = states.get(position, (0, ()))
+            states[position] = (value, glyphs + (glyph,))
+        return states
+
+    def draw_cell(self, cell, state):
+        rect = self.rect(cell)
+        # Clipped so glyphs wider than a cell cannot leave marks outside the dirty rectangle
+        self.screen.set_clip(rect)
+        self.screen.blit(self.background, rect, rect)
+        if state is not None:
+            trash_count, glyphs = state
+            if trash_count > 0:
+                self.screen.blit(self.glyph(trash_count), rect.topleft)
+            for glyph in glyphs:
+                self.screen.blit(self.agent_imgs[glyph], rect)
+        self.screen.set_clip(None)
+        return rect
+
+    def glyph(self, trash_count):
+        text = self.glyphs.get(trash_count)
+        if text is None:
+            text = self.glyphs[trash_count] = self.font.render(str(trash_count), True, (0, 0, 0))
+        return text
+
+    def rect(self, position):
+        x, y = position
+        return pygame.Rect(x * self.cell_size, y * self.cell_size, self.cell_size, self.cell_size)
+
+    def load_image(self, path):
+        image = pygame.image.load(path)
+        return pygame.transform.scale(image, (self.cell_size, self.cell_size))
+
+    def load_images(self):
+        self.house_img = self.load_image("icons/house.png")
+        self.office_img = self.load_image("icons/office.png")
+        self.park_img = self.load_image("icons/004-park.png")
+        self.trash_bin_img = self.load_image("icons/bin.png")
+        self.agent_littering_img = self.load_image("icons/redman.png")
+        self.agent_punished_img = self.load_image("icons/Sanction List.png")
+        self.agent_bin_img = self.load_image("icons/blueman.png")
+        self.agent_normal_img = self.load_image("icons/blackman.png")
+        self.agent_imgs = {LITTERING: self.agent_littering_img, COMPLIANT: self.agent_bin_img, NORMAL: self.agent_normal_img}
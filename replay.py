@@ -0,0 +1,89 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+
+from trajectory_log import TrajectoryLog
+
+
+def export(log_path, frames_dir=None, video=None, cell_size=30, fps=30, every=1, start=0, stop=None):
+    """Render a trajectory log to numbered PNG frames and/or a video.
+
+    Frames are drawn off screen with PygameRenderer, so only the cells that
+    changed between exported frames are redrawn. Video is encoded by piping
+    the frames to ffmpeg, which has to be on PATH.
+    """
+    # Headless: nothing is shown, frames are only read back from the surface
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    from render import PygameRenderer
+
+    if frames_dir is None and video is None:
+        raise ValueError('Nothing to export: give frames_dir and/or video')
+    if video is not None and shutil.which('ffmpeg') is None:
+        raise RuntimeError('Video export needs ffmpeg on PATH')
+    if frames_dir is not None and not os.path.exists(frames_dir):
+        os.makedirs(frames_dir)
+
+    log = TrajectoryLog(log_path)
+    renderer = PygameRenderer(cell_size=cell_size)
+    encoder = None
+    to_bytes = getattr(pygame.image, 'tobytes', None) or pygame.image.tostring
+    exported = 0
+    try:
+        for state in log.frames():
+            if stop is not None and state.step >= stop:
+                break
+            if state.step < start or (state.step - start) % every:
+                continue
+            if renderer.screen is None:
+                renderer.on_start(state)
+                width, height = renderer.screen.get_size()
+                if video is not None:
+                    encoder = subprocess.Popen([
+                        'ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                        '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                        # yuv420p needs even dimensions
+                        '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', video,
+                    ], stdin=subprocess.PIPE)
+            renderer.draw(state)
+            if frames_dir is not None:
+                pygame.image.save(renderer.screen, os.path.join(frames_dir, f'step_{state.step:06d}.png'))
+            if encoder is not None:
+                encoder.stdin.write(to_bytes(renderer.screen, 'RGB'))
+            exported += 1
+    finally:
+        if encoder is not None:
+            encoder.stdin.close()
+            encoder.wait()
+        if renderer.screen is not None:
+            renderer.on_end(state)
+    return exported
+
+
+def export_in_background(log_path, **kwargs):
+    # Export from a separate process so a sweep can carry on; join() the returned process to wait for it
+    process = multiprocessing.Process(target=export, args=(log_path,), kwargs=kwargs)
+    process.start()
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a trajectory log written by trajectory_log.TrajectoryLogger')
+    parser.add_argument('log')
+    parser.add_argument('--frames-dir', default=None, help='folder for one PNG per exported step')
+    parser.add_argument('--video', default=None, help='video file to encode with ffmpeg, e.g. run.mp4')
+    parser.add_argument('--cell-size', type=int, default=30)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--every', type=int, default=1, help='export every n-th step')
+    parser.add_argument('--start', type=int, default=0, help='first step to export')
+    parser.add_argument('--stop', type=int, default=None, help='step to stop before')
+    args = parser.parse_args()
+
+    exported = export(args.log, args.frames_dir, args.video, args.cell_size, args.fps, args.every, args.start, args.stop)
+    print(f'Exported {exported} frames')
+
+
+if __name__ == '__main__':
+    main()
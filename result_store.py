@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: appends fall back to one unlocked O_APPEND write per record
+    fcntl = None
+
+SERIES = ('compliance', 'cleanliness', 'sanctions')
+
+
+def record_dtype(steps):
+    # One fixed-size record per run; series shorter than steps (early stops) are padded with their last value
+    return np.dtype([
+        ('world_size', 'S16'),
+        ('density', 'S16'),
+        ('method', 'S24'),
+        ('run', np.int32),
+        ('length', np.int32),
+        ('average_compliance', np.float64),
+        ('average_sanctions_per_agent', np.float64),
+    ] + [(name, np.float64, (steps,)) for name in SERIES])
+
+
+class ResultStore:
+    """Append-only binary store of sweep results, one record per run.
+
+    Records live back to back in records.bin with the dtype from
+    record_dtype(steps); meta.json holds steps. Any number of processes can
+    append at once (each record is one O_APPEND write, locked where fcntl
+    exists), and readers map the file read-only, so selecting a
+    configuration's series is a view.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.steps = json.load(f)['steps']
+        self.dtype = record_dtype(self.steps)
+        self.records_path = os.path.join(path, 'records.bin')
+
+    @classmethod
+    def create(cls, path, steps, overwrite=False):
+        if os.path.exists(path):
+            if not overwrite:
+                raise FileExistsError(f'Result store {path} already exists')
+            shutil.rmtree(path)
+        os.makedirs(path)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'steps': steps}, f)
+        open(os.path.join(path, 'records.bin'), 'wb').close()
+        return cls(path)
+
+    def append(self, world_size, density, method, run, result):
+        record = np.zeros(1, dtype=self.dtype)
+        record['world_size'] = world_size
+        record['density'] = density
+        record['method'] = method
+        record['run'] = run
+        record['average_compliance'] = result['average_compliance']
+        record['average_sanctions_per_agent'] = result['average_sanctions_per_agent']
+        record['length'] = len(result['compliance_over_time'])
+        for name, key in zip(SERIES, ('compliance_over_time', 'cleanliness_over_time', 'sanctions_over_time')):
+            series = np.asarray(result[key], dtype=np.float64)[:self.steps]
+            record[name][0, :len(series)] = series
+            record[name][0, len(series):] = series[-1]
+
+        # O_BINARY keeps Windows from translating newline bytes in the record
+        fd = os.open(self.records_path, os.O_WRONLY | os.O_APPEND | getattr(os, 'O_BINARY', 0))
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, record.tobytes())
+        finally:
+            os.close(fd)
+
+    def records(self):
+        # Read-only mapping of every complete record
+        count = os.path.getsize(self.records_path) // self.dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(self.records_path, dtype=self.dtype, mode='r', shape=(count,))
+
+    def configurations(self):
+        # Sorted (world_size, density, method) triples present in the store
+        records = self.records()
+        keys = set(zip(records['world_size'].tolist(), records['density'].tolist(), records['method'].tolist()))
+        return sorted(tuple(part.decode() for part in key) for key in keys)
+
+    def select(self, world_size=None, density=None, method=None):
+        # Indices of the records matching every given field
+        records = self.records()
+        mask = np.ones(len(records), dtype=bool)
+        for field, value in (('world_size', world_size), ('density', density), ('method', method)):
+            if value is not None:
+                mask &= records[field] == value.encode()
+        return np.flatnonzero(mask)
+
+    def series(self, name, world_size=None, density=None, method=None):
+        # (runs x steps) array of one series for the matching runs
+        records = self.records()
+        index = self.select(world_size, density, method)
+        # Contiguous matches (a configuration written in one go) stay a view of the mapping
+        if len(index) and index[-1] - index[0] + 1 == len(index):
+            return records[name][index[0]:index[-1] + 1]
+        return records[name][index]
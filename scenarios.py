@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from utils import initial_map
+
+
+def cell_ids(positions, height):
+    return np.array([x * height + y for x, y in positions], dtype=np.int64)
+
+
+def neighbor_table(width, height):
+    # Flat cell ids of the four neighbours in GridWorld.get_neighborhood order; -1 marks off-grid
+    x, y = np.divmod(np.arange(width * height), height)
+    neighbors = np.full((width * height, 4), -1, dtype=np.int64)
+    for i, (dx, dy) in enumerate([(-1, 0), (1, 0), (0, -1), (0, 1)]):
+        nx, ny = x + dx, y + dy
+        inside = (nx >= 0) & (nx < width) & (ny >= 0) & (ny < height)
+        neighbors[inside, i] = nx[inside] * height + ny[inside]
+    return neighbors
+
+
+def nearest_bin_table(width, height, bins, cells=None):
+    # Manhattan-nearest bin per cell (or per given cell), first bin winning ties like min() over env.trash_bins
+    if cells is None:
+        cells = np.arange(width * height)
+    nearest = np.zeros(len(cells), dtype=np.int64)
+    if len(bins) == 0:
+        return nearest
+    bx, by = np.divmod(bins, height)
+    # Cells per chunk kept small: the (cells x bins) distance block and its temporaries dominate peak memory
+    chunk = max(1, 2 ** 18 // len(bins))
+    for lo in range(0, len(cells), chunk):
+        x, y = np.divmod(cells[lo:lo + chunk], height)
+        distance = np.abs(x[:, None] - bx[None, :]) + np.abs(y[:, None] - by[None, :])
+        nearest[lo:lo + len(x)] = bins[np.argmin(distance, axis=1)]
+    return nearest
+
+
+def distance_field(neighbors, passable, sources, source_distances=None):
+    # Breadth-first distance from every cell to the nearest passable source; -1 = unreachable.
+    # With source_distances each source starts at its own distance instead of 0.
+    field = np.full(len(passable), -1, dtype=np.int32)
+    if source_distances is None:
+        source_distances = np.zeros(len(sources), dtype=np.int64)
+    keep = passable[sources]
+    order = np.argsort(source_distances[keep], kind='stable')
+    sources, source_distances = sources[keep][order], source_distances[keep][order]
+    frontier = np.zeros(0, dtype=np.int64)
+    distance = 0
+    seeded = 0
+    while frontier.size or seeded < len(sources):
+        if not frontier.size:
+            distance = max(distance, int(source_distances[seeded]))
+        # Sources starting at this distance join the frontier
+        joined = np.searchsorted(source_distances, distance, side='right')
+        frontier = np.unique(np.concatenate([frontier, sources[seeded:joined]]))
+        seeded = joined
+        frontier = frontier[field[frontier] < 0]
+        field[frontier] = distance
+        reached = neighbors[frontier].ravel()
+        reached = reached[reached >= 0]
+        frontier = reached[(field[reached] < 0) & passable[reached]]
+        distance += 1
+    # Thousands of fields can be cached at once, so keep them small when distances allow
+    if distance <= np.iinfo(np.int16).max:
+        field = field.astype(np.int16)
+    return field
+
+
+class Scenario:
+    """A generated map and its static tables, loaded from a ScenarioStore directory.
+
+    Cells are flat ids (x * height + y). Tables are memory-mapped read-only:
+    neighbors, nearest_bin, bin_mask, home_or_office_mask, and goal_fields,
+    the distance field of every destination and bin on the empty map (row i
+    belongs to goals[i]).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'scenario.json')) as f:
+            meta = json.load(f)
+        self.num_agents = meta['num_agents']
+        self.width = meta['width']
+        self.height = meta['height']
+        self.seed = meta['seed']
+        self.house_positions = [tuple(p) for p in meta['house_positions']]
+        self.office_positions = [tuple(p) for p in meta['office_positions']]
+        self.park_positions = [tuple(p) for p in meta['park_positions']]
+        self.trash_bins = [tuple(p) for p in meta['trash_bins']]
+        for name in ('neighbors', 'nearest_bin', 'bin_mask', 'home_or_office_mask', 'goals', 'goal_fields'):
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+        self.goal_rows = {int(goal): row for row, goal in enumerate(self.goals)}
+
+    @property
+    def layout(self):
+        # Same tuple as utils.initial_map
+        return self.house_positions, self.office_positions, self.park_positions, self.trash_bins
+
+    def goal_field(self, goal):
+        # Empty-map distance field to flat cell goal, or None if it was not precomputed
+        row = self.goal_rows.get(goal)
+        return None if row is None else self.goal_fields[row]
+
+
+def build_scenario(path, num_agents, width, height, seed):
+    house_positions, office_positions, park_positions, trash_bins = initial_map(num_agents, width, height, seed)
+    num_cells = width * height
+    neighbors = neighbor_table(width, height)
+    bins = cell_ids(trash_bins, height)
+    bin_mask = np.zeros(num_cells, dtype=bool)
+    bin_mask[bins] = True
+    home_or_office_mask = np.zeros(num_cells, dtype=bool)
+    home_or_office_mask[cell_ids(house_positions + office_positions, height)] = True
+    goals = np.unique(np.concatenate([cell_ids(house_positions + office_positions + park_positions, height), bins]))
+    passable = np.ones(num_cells, dtype=bool)
+    goal_fields = np.stack([distance_field(neighbors, passable, goals[i:i + 1]) for i in range(len(goals))]) if len(goals) else np.zeros((0, num_cells), dtype=np.int16)
+
+    # Written next to the final directory and renamed into place, so concurrent workers
+    # never see a half-written scenario
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent)
+    with open(os.path.join(staging, 'scenario.json'), 'w') as f:
+        json.dump({
+            'num_agents': num_agents, 'width': width, 'height': height, 'seed': seed,
+            'house_positions': house_positions, 'office_positions': office_positions,
+            'park_positions': park_positions, 'trash_bins': trash_bins,
+        }, f)
+    for name, table in (('neighbors', neighbors), ('nearest_bin', nearest_bin_table(width, height, bins)),
+                        ('bin_mask', bin_mask), ('home_or_office_mask', home_or_office_mask),
+                        ('goals', goals), ('goal_fields', goal_fields)):
+        np.save(os.path.join(staging, f'{name}.npy'), table)
+    try:
+        os.rename(staging, path)
+    except OSError:
+        # Another process stored the same scenario first
+        shutil.rmtree(staging)
+
+
+class ScenarioStore:
+    """On-disk cache of scenarios keyed by (num_agents, width, height, seed)."""
+
+    def __init__(self, root='scenarios'):
+        self.root = root
+
+    def path_for(self, num_agents, width, height, seed=44):
+        return os.path.join(self.root, f'{num_agents}agents_{width}x{height}_seed{seed}')
+
+    def get(self, num_agents, width, height, seed=44):
+        path = self.path_for(num_agents, width, height, seed)
+        if not os.path.exists(path):
+            build_scenario(path, num_agents, width, height, seed)
+        return Scenario(path)
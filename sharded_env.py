@@ -0,0 +1,404 @@
+import multiprocessing
+
+import numpy as np
+
+from recorder import MetricsRecorder
+from scenarios import Scenario, neighbor_table, nearest_bin_table, distance_field
+from vector_env import ObservedWorld, VectorGridWorld, SANCTION
+
+
+def empty_ids():
+    return np.zeros(0, dtype=np.int64)
+
+
+def shard_regions(bounds, width, observation_radius):
+    # Columns each shard holds: its strip plus the margin its agents can see or step into
+    margin = max(observation_radius, 1)
+    return np.maximum(bounds[:-1] - margin, 0), np.minimum(bounds[1:] + margin, width)
+
+
+class GridShard(VectorGridWorld):
+    """One vertical strip of a ShardedGridWorld, stepped in its own process.
+
+    The shard owns the agents standing in columns [lo, hi) and holds only
+    its region: the strip plus a margin of max(observation_radius, 1)
+    columns on either side, kept up to date with the other shards' trash
+    changes before every step. It is a VectorGridWorld of the region's
+    width whose cell ids are the global ids minus the region's first cell,
+    so destinations and bins outside the region get ids outside
+    [0, num_cells). Routes are planned within the region: a goal outside it
+    is reached through the region's edge column, at that column's Manhattan
+    distance from the goal, and a sanctioned agent looks for trash within
+    the region. Agents are stored by global id (agent_id); a step runs the
+    VectorGridWorld rules on the owned agents with three exchanges standing
+    in for the neighbours: litterers within the observation radius of the
+    strip (the halo) can be sanctioned, sanctions of owned agents by other
+    shards arrive with the sanctioner's position, and agents that walk out
+    of the strip move to the shard that owns their new column.
+    """
+
+    SHARD_FIELDS = VectorGridWorld.AGENT_FIELDS + ('agent_id', 'pending')
+    # Fields holding cells, exchanged as global ids
+    CELL_FIELDS = ('start', 'end', 'position', 'leg_goal', 'leg_origin')
+
+    def __init__(self, shard, bounds, width, height, num_agents, method, b, initial_compliant_probs, house_positions, office_position, park_positions, trash_bins, num_run, t, observation_radius, seed=None, agent_ids=None, scenario=None):
+        self.shard = shard
+        self.bounds = bounds
+        self.lo, self.hi = bounds[shard], bounds[shard + 1]
+        region_lo, region_hi = shard_regions(bounds, width, observation_radius)
+        self.region_lo = int(region_lo[shard])
+        self.base = self.region_lo * height
+        self.full_width = width
+        self.agent_id = np.asarray(agent_ids, dtype=np.int64)
+        super().__init__(int(region_hi[shard]) - self.region_lo, height, len(self.agent_id), method, b, initial_compliant_probs,
+                         house_positions, office_position, park_positions, trash_bins, num_run, t, observation_radius,
+                         seed=[seed, shard + 1], scenario=scenario)
+        # Sanctions received last step, applied at the next update as VectorGridWorld's observe would
+        self.pending = np.zeros(len(self.agent_id), dtype=np.int64)
+
+        self.central_check = False
+        self.halo_ids = empty_ids()
+        self.halo_positions = empty_ids()
+        self.remote_sanctions = (empty_ids(), empty_ids())
+        self.trash_log = None
+
+    # Region-local tables
+
+    def cells(self, positions):
+        return super().cells(positions) - self.base
+
+    def inside(self, cells):
+        return (cells >= 0) & (cells < self.num_cells)
+
+    def columns(self, cells):
+        # Global column of region cells
+        return cells // self.height + self.region_lo
+
+    def build_map(self, scenario):
+        bins = self.cells(self.trash_bins)
+        self.bin_mask = np.zeros(self.num_cells, dtype=bool)
+        self.bin_mask[bins[self.inside(bins)]] = True
+        homes = self.cells(self.house_positions + self.office_position)
+        self.home_or_office_mask = np.zeros(self.num_cells, dtype=bool)
+        self.home_or_office_mask[homes[self.inside(homes)]] = True
+        self.destinations = self.cells(self.house_positions + self.office_position + self.park_positions)
+        self.neighbors = neighbor_table(self.width, self.height)
+        if scenario is not None:
+            self.nearest_bin = scenario.nearest_bin[self.base:self.base + self.num_cells] - self.base
+        else:
+            region = np.arange(self.base, self.base + self.num_cells)
+            self.nearest_bin = nearest_bin_table(self.full_width, self.height, bins + self.base, region) - self.base
+
+    def load_goal_fields(self, scenario):
+        # The region's slice of every mapped field; only the pages the shard reads are loaded
+        for goal, field in zip(scenario.goals.tolist(), scenario.goal_fields):
+            self.flow_fields[goal - self.base] = field[self.base:self.base + self.num_cells]
+            self.field_versions[goal - self.base] = self.passability_version
+            self.preloaded_fields.add(goal - self.base)
+
+    def initial_agents(self, initial_compliant_probs):
+        houses = self.cells(self.house_positions)
+        return houses[self.agent_id % len(houses)], np.asarray(initial_compliant_probs, dtype=np.float64)[self.agent_id]
+
+    def build_flow_field(self, goal):
+        if self.inside(goal):
+            return self.compute_distance_field(np.array([goal], dtype=np.int64))
+        # Enter the region through the edge column facing the goal, at its Manhattan distance from it
+        x, y = divmod(goal, self.height)
+        edge = 0 if x < 0 else self.width - 1
+        rows = np.arange(self.height, dtype=np.int64)
+        return distance_field(self.neighbors, self.passable, edge * self.height + rows, abs(x - edge) + np.abs(rows - y))
+
+    def field_keys(self, goals):
+        return goals
+
+    def passable_goals(self, goals):
+        # Goals outside the region count as passable until an agent gets near them
+        passable = np.ones(len(goals), dtype=bool)
+        inside = self.inside(goals)
+        passable[inside] = self.passable[goals[inside]]
+        return passable
+
+    def owns(self, cells):
+        x = self.columns(cells)
+        return (x >= self.lo) & (x < self.hi)
+
+    def keep(self, mask):
+        for name in self.SHARD_FIELDS:
+            setattr(self, name, getattr(self, name)[mask])
+
+    def take(self, mask):
+        rows = {name: getattr(self, name)[mask] for name in self.SHARD_FIELDS}
+        for name in self.CELL_FIELDS:
+            rows[name] += self.base
+        self.keep(~mask)
+        return rows
+
+    def put(self, batches):
+        if not batches:
+            return
+        rows = {name: np.concatenate([batch[name] for batch in batches]) for name in self.SHARD_FIELDS}
+        for name in self.CELL_FIELDS:
+            rows[name] -= self.base
+        # A route planned outside the region resumes from where the agent entered it
+        outside = ~self.inside(rows['leg_origin'])
+        rows['leg_origin'][outside] = rows['position'][outside]
+        for name in self.SHARD_FIELDS:
+            setattr(self, name, np.concatenate([getattr(self, name), rows[name]]))
+        # Keep agents ordered by id, so incoming sanctions can be looked up by search
+        order = np.argsort(self.agent_id, kind='stable')
+        for name in self.SHARD_FIELDS:
+            setattr(self, name, getattr(self, name)[order])
+
+    # Hooks into VectorGridWorld.step
+
+    def observe_sanctions(self, observed):
+        received = self.pending
+        self.pending = np.zeros(len(self.position), dtype=np.int64)
+        return received
+
+    def central_checks(self):
+        # The coordinator draws Hybrid's check once per step for the whole world
+        if self.method == 'Centralised-end':
+            return np.ones(1, dtype=bool)
+        return np.array([self.central_check])
+
+    def record_metrics(self):
+        pass
+
+    def choose_sanctions(self, willing, observed):
+        # Halo litterers are appended after the owned agents; pairs with them are sent to their owners
+        count = len(observed)
+        positions = np.concatenate([observed, self.halo_positions])
+        targets = np.concatenate([np.flatnonzero(self.littered), count + np.arange(len(self.halo_ids))])
+        sanctioners, targets = self.pairs_within(np.flatnonzero(willing), targets, positions)
+        remote = targets >= count
+        self.remote_sanctions = (self.halo_ids[targets[remote] - count], sanctioners[remote])
+        self.action[sanctioners[remote]] = SANCTION
+        self.total_sanctions += int(remote.sum())
+        return sanctioners[~remote], targets[~remote]
+
+    def apply_trash(self, changed, after):
+        if self.trash_log is not None:
+            self.trash_log.append((changed, self.trash[changed], after))
+        super().apply_trash(changed, after)
+
+    # Exchange with the coordinator
+
+    def sync(self, inbox):
+        # Other shards' trash changes in the region, agents entering the strip and sanctions by other shards' agents
+        cells, after = inbox['trash']
+        if len(cells):
+            self.apply_trash(cells - self.base, after)
+        self.put(inbox['migrants'])
+        target_ids, sanctioner_positions = inbox['sanctions']
+        sanctioner_positions = sanctioner_positions - self.base
+        if len(target_ids):
+            targets = np.searchsorted(self.agent_id, target_ids)
+            self.was_sanctioned[targets] = True
+            target_positions = self.position[targets]
+            close = np.abs(sanctioner_positions // self.height - target_positions // self.height) + np.abs(sanctioner_positions % self.height - target_positions % self.height) <= self.observation_radius
+            np.add.at(self.pending, targets[close], 1)
+        halo_ids, halo_positions = inbox['halo']
+        self.halo_ids, self.halo_positions = halo_ids, halo_positions - self.base
+
+    def step_shard(self, inbox, central_check, record_agents):
+        self.sync(inbox)
+        self.central_check = central_check
+        sanctions_before = int(self.total_sanctions[0])
+        self.trash_log = []
+        self.step()
+        self.step_id += 1
+        trash_log, self.trash_log = self.trash_log, None
+
+        # This step's sanctions between owned agents are observed from the positions the next step starts at
+        self.pending += VectorGridWorld.observe_sanctions(self, self.position)
+        self.sanction_pairs = (empty_ids(), empty_ids())
+        target_ids, sanctioners = self.remote_sanctions
+        self.remote_sanctions = (empty_ids(), empty_ids())
+
+        # Litterers the neighbouring strips can see next step
+        litterers = np.flatnonzero(self.littered)
+        x = self.columns(self.position[litterers])
+        halo = {}
+        radius = self.observation_radius
+        for neighbour, near in ((self.shard - 1, x - radius < self.lo), (self.shard + 1, x + radius >= self.hi)):
+            if 0 <= neighbour < len(self.bounds) - 1 and near.any():
+                halo[neighbour] = (self.agent_id[litterers[near]], self.position[litterers[near]] + self.base)
+
+        if trash_log:
+            cells, before, after = (np.concatenate(parts) for parts in zip(*trash_log))
+            trash = (cells + self.base, before, after)
+        else:
+            trash = (empty_ids(), empty_ids(), empty_ids())
+        result = {
+            'trash': trash,
+            'sanctions': (target_ids, self.position[sanctioners] + self.base),
+            'halo': halo,
+            'compliance_sum': float(self.compliant_prob.sum()),
+            'new_sanctions': int(self.total_sanctions[0]) - sanctions_before,
+        }
+        if record_agents:
+            result['agents'] = (self.agent_id, self.compliant_prob.copy(), self.sanctioned.copy())
+
+        # Agents that left the strip go to the shard owning their new column
+        leaving = ~self.owns(self.position)
+        migrants = {}
+        if leaving.any():
+            rows = self.take(leaving)
+            owners = np.searchsorted(self.bounds, rows['position'] // self.height, side='right') - 1
+            for owner in np.unique(owners).tolist():
+                migrants[owner] = {name: values[owners == owner] for name, values in rows.items()}
+        result['migrants'] = migrants
+        return result
+
+
+def run_shard(conn, shard, bounds, args, kwargs):
+    # Worker process loop: one ('step', inbox, central_check, record_agents) message per step until ('close',)
+    if kwargs.get('scenario') is not None:
+        # Every worker maps the stored tables instead of building its own
+        kwargs = dict(kwargs, scenario=Scenario(kwargs['scenario']))
+    world = GridShard(shard, bounds, *args, **kwargs)
+    conn.send('ready')
+    while True:
+        message = conn.recv()
+        if message[0] == 'close':
+            break
+        conn.send(world.step_shard(*message[1:]))
+    conn.close()
+
+
+class ShardedGridWorld(ObservedWorld):
+    """VectorGridWorld split into vertical strips stepped by worker processes.
+
+    For grids and populations too large for one process. The width is cut
+    into `shards` strips of columns, each owned by a GridShard process that
+    steps the agents standing in it and holds only the cells and distance
+    fields of its strip and a margin around it. Every step the coordinator
+    sends each shard what the others produced last step (trash changes in
+    its region, agents that crossed into its strip, sanctions of its agents
+    and the halo of litterers within the observation radius of its border)
+    and reduces the shards' replies into the same series as GridWorld and
+    VectorGridWorld: recorder and the *_over_time attributes. Per-agent
+    trajectories are only gathered with record_agents=True.
+
+    The rules are VectorGridWorld's; Hybrid's central check is drawn once
+    per step by the coordinator. Each shard draws from its own stream, so a
+    run is reproducible for a given seed and shard count but is not the
+    same run as a VectorGridWorld with that seed; routes are planned
+    within each shard's region (see GridShard). A scenarios.Scenario of
+    the map is opened by every worker, which then maps its tables instead
+    of building them. Call close() (or use the world as a context manager)
+    to stop the workers.
+    """
+
+    def __init__(self, width, height, num_agents, method, b, initial_compliant_probs, house_positions, office_position, park_positions, trash_bins, num_run, t, observation_radius, seed=None, observers=None, shards=2, record_agents=False, scenario=None):
+        self.width = width
+        self.height = height
+        self.num_agents = num_agents
+        self.method = method
+        self.b = b
+        self.num_run = num_run
+        self.t = t
+        self.observation_radius = observation_radius
+        self.num_cells = width * height
+        self.bounds = np.linspace(0, width, shards + 1).astype(np.int64)
+        if np.diff(self.bounds).min() <= observation_radius:
+            raise ValueError(f'{shards} shards of a width {width} grid are narrower than the observation radius {observation_radius} allows')
+        self.region_lo, self.region_hi = shard_regions(self.bounds, width, observation_radius)
+        self.shards = shards
+        self.record_agents = record_agents
+        # Shards derive their streams from the seed, so it has to be fixed here
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        self.rng = np.random.default_rng([seed, 0])
+        self.step_id = 0
+        self.observers = list(observers) if observers else []
+        self.stop_step = None
+        self.recorder = MetricsRecorder(num_agents if record_agents else 0)
+        self.recorders = [self.recorder]
+        self.compliant_prob = np.asarray(initial_compliant_probs, dtype=np.float64).copy() if record_agents else np.zeros(0)
+        self.sanctioned = np.zeros(num_agents if record_agents else 0, dtype=np.int64)
+        self.clean_cells = self.num_cells
+        self.total_sanctions = 0
+
+        # Agents start at the houses in turn, as in VectorGridWorld
+        house_x = np.array([x for x, _ in house_positions], dtype=np.int64)
+        self.owner = np.searchsorted(self.bounds, house_x[np.arange(num_agents) % len(house_x)], side='right') - 1
+
+        args = (width, height, num_agents, method, b, initial_compliant_probs, house_positions, office_position, park_positions, trash_bins, num_run, t, observation_radius)
+        context = multiprocessing.get_context()
+        self.connections = []
+        self.workers = []
+        for shard in range(shards):
+            parent, child = context.Pipe()
+            kwargs = {'seed': seed, 'agent_ids': np.flatnonzero(self.owner == shard),
+                      'scenario': scenario.path if scenario is not None else None}
+            worker = context.Process(target=run_shard, args=(child, shard, self.bounds, args, kwargs), daemon=True)
+            worker.start()
+            child.close()
+            self.connections.append(parent)
+            self.workers.append(worker)
+        for connection in self.connections:
+            connection.recv()
+        self.inboxes = [self.empty_inbox() for _ in range(shards)]
+
+    def empty_inbox(self):
+        return {'trash': (empty_ids(), empty_ids()), 'migrants': [], 'sanctions': (empty_ids(), empty_ids()), 'halo': (empty_ids(), empty_ids())}
+
+    def step(self):
+        central_check = self.method == 'Centralised-end' or (self.method == 'Hybrid' and self.rng.random() >= self.b)
+        for connection, inbox in zip(self.connections, self.inboxes):
+            connection.send(('step', inbox, central_check, self.record_agents))
+        results = [connection.recv() for connection in self.connections]
+
+        # Route what every shard produced to the shards that need it next step
+        inboxes = [self.empty_inbox() for _ in range(self.shards)]
+        for result in results:
+            for owner, rows in result['migrants'].items():
+                self.owner[rows['agent_id']] = owner
+                inboxes[owner]['migrants'].append(rows)
+        cells, before, after = (np.concatenate(parts) for parts in zip(*(result['trash'] for result in results)))
+        self.clean_cells += int(((before > 0) & (after == 0)).sum()) - int(((before == 0) & (after > 0)).sum())
+        cell_x = cells // self.height
+        cell_owner = np.searchsorted(self.bounds, cell_x, side='right') - 1
+        target_ids, sanctioner_positions = (np.concatenate(parts) for parts in zip(*(result['sanctions'] for result in results)))
+        target_owner = self.owner[target_ids]
+        for shard, inbox in enumerate(inboxes):
+            seen = (cell_owner != shard) & (cell_x >= self.region_lo[shard]) & (cell_x < self.region_hi[shard])
+            inbox['trash'] = (cells[seen], after[seen])
+            mine = target_owner == shard
+            inbox['sanctions'] = (target_ids[mine], sanctioner_positions[mine])
+            halo = [result['halo'][shard] for result in results if shard in result['halo']]
+            if halo:
+                inbox['halo'] = tuple(np.concatenate(parts) for parts in zip(*halo))
+        self.inboxes = inboxes
+
+        # Reduce the shards' metrics into the run's series
+        self.total_sanctions += sum(result['new_sanctions'] for result in results)
+        average_compliance = sum(result['compliance_sum'] for result in results) / self.num_agents if self.num_agents else 0.0
+        if self.record_agents:
+            for result in results:
+                ids, compliant_prob, sanctioned = result['agents']
+                self.compliant_prob[ids] = compliant_prob
+                self.sanctioned[ids] = sanctioned
+        self.recorder.record(
+            self.compliant_prob, self.sanctioned, average_compliance,
+            self.clean_cells, self.compute_percentage_clean_cells(), self.total_sanctions
+        )
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(('close',))
+            connection.close()
+        for worker in self.workers:
+            worker.join()
+        self.connections = []
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
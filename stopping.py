@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class ConvergenceStop:
+    """Observer that ends a run once its metrics have settled.
+
+    A run stops when, over the last `window` steps, every series in
+    `tolerances` moved by at most its tolerance (max - min), or as soon as
+    average compliance reaches `norm_level`. Nothing is checked before
+    `min_steps`. The step the run stopped at is kept in `stop_step` and
+    set on the env; `norm_emergence_step` is the first step compliance
+    reached `norm_level`.
+    """
+
+    def __init__(self, window=50, tolerances=None, norm_level=None, min_steps=0):
+        self.window = window
+        # Compliance is a probability and cleanliness a percentage, hence separate tolerances
+        self.tolerances = tolerances if tolerances is not None else {'compliance_over_time': 1e-3, 'cleanliness_over_time': 0.5}
+        self.norm_level = norm_level
+        self.min_steps = min_steps
+        self.stop_step = None
+        self.norm_emergence_step = None
+
+    def on_start(self, env):
+        # Per-run state, cleared when a run starts from its first step so one observer
+        # can be reused across runs and worlds; a continued run keeps it
+        if len(env.compliance_over_time) == 0:
+            self.stop_step = None
+            self.norm_emergence_step = None
+
+    def on_step(self, env):
+        compliance = env.compliance_over_time
+        steps = len(compliance)
+        if self.norm_level is not None and self.norm_emergence_step is None and compliance[-1] >= self.norm_level:
+            self.norm_emergence_step = steps - 1
+        if steps < max(self.min_steps, 1):
+            return True
+
+        if self.norm_emergence_step is not None:
+            return self.stop(env, steps - 1)
+        if self.tolerances and steps >= self.window:
+            settled = all(np.ptp(getattr(env, name)[-self.window:]) <= tolerance for name, tolerance in self.tolerances.items())
+            if settled:
+                return self.stop(env, steps - 1)
+        return True
+
+    def on_end(self, env):
+        pass
+
+    def stop(self, env, step):
+        self.stop_step = step
+        env.stop_step = step
+        return False
@@ -0,0 +1,20 @@
+import zlib
+
+
+# Configurations swept by main.py and measured by benchmark.py; kept free of heavy imports
+world_sizes = {
+    'Small': (20, 20),
+    'Large': (40, 40)
+}
+agent_densities = {
+    'Sparse': {'Small': 3, 'Large': 12},
+    # 'Sparse': {'Small': 5, 'Large': 50},
+    'Natural': {'Small': 10, 'Large': 40},
+    # 'Dense': {'Small': 20, 'Large': 500},
+    'Dense': {'Small': 30, 'Large': 120}
+}
+
+
+def run_seed(seed, world_size_name, density_name, method, run):
+    # Derived from the configuration only, so a run gives the same result on any worker
+    return zlib.crc32(f'{seed}_{world_size_name}_{density_name}_{method}_{run}'.encode())
@@ -1,7 +1,8 @@
-import os
 import pandas as pd
 import numpy as np
 from scipy import stats
+from concurrent.futures import ProcessPoolExecutor
+from result_store import ResultStore
 
 
 metrics = ['average_compliance', 'average_cleanliness', 'average_sanctions']
@@ -10,55 +11,75 @@ metrics = ['average_compliance', 'average_cleanliness', 'average_sanctions']
 methods = ['Hybrid','Centralised-end', 'Decentralised']
 
 
-data_dict = {}
-
-
-results_folder = 'results' 
-for folder_name in os.listdir(results_folder):
-    folder_path = os.path.join(results_folder, folder_name)
-    if os.path.isdir(folder_path):
-        try:
-            world_size, density, method = folder_name.split('_')
-        except ValueError:
-            continue 
-
-        if method not in methods:
-            continue 
-
-
-        csv_file = os.path.join(folder_path, 'average_compliance_over_time.csv')
-        if os.path.exists(csv_file):
-            df = pd.read_csv(csv_file)
-            key = (world_size, density, method)
-            # 将数据存入字典
-            if key not in data_dict:
-                data_dict[key] = []
-            data_dict[key].append(df)
-
-
-test_results = []
-
-
-world_density_keys = set([(key[0], key[1]) for key in data_dict.keys()])
-
-for (world_size, density) in world_density_keys:
-    method_data = {}
-    for method in methods:
-        key = (world_size, density, method)
-        if key in data_dict:
-            method_dfs = data_dict[key]
-            combined_df = pd.concat(method_dfs, ignore_index=True)
-            avg_df = combined_df.groupby('time_step').mean().reset_index()
-            method_data[method] = avg_df
+result_store_path = 'results/store' # written by main.py
+# Store series behind each tested metric
+store_series = {'average_compliance': 'compliance', 'average_cleanliness': 'cleanliness', 'average_sanctions': 'sanctions'}
+chunk_size = 256 # runs folded into the running statistics at a time
+
+
+class RunningStats:
+    # Per-time-step count, mean and sum of squared deviations, updated chunk by chunk (Welford/Chan)
+    def __init__(self):
+        self.count = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+    def update(self, time_steps, values):
+        length = max(len(self.count), int(time_steps.max()) + 1)
+        padding = np.zeros(length - len(self.count))
+        if len(padding):
+            for name in ('count', 'mean', 'm2'):
+                setattr(self, name, np.concatenate([getattr(self, name), padding]))
+
+        # Statistics of the chunk alone
+        count = np.bincount(time_steps, minlength=length).astype(float)
+        seen = count > 0
+        mean = np.zeros(length)
+        mean[seen] = np.bincount(time_steps, weights=values, minlength=length)[seen] / count[seen]
+        m2 = np.bincount(time_steps, weights=(values - mean[time_steps]) ** 2, minlength=length)
+
+        # Merge them into the running statistics
+        total = self.count + count
+        delta = mean - self.mean
+        merged = total > 0
+        self.mean[merged] += delta[merged] * count[merged] / total[merged]
+        self.m2[merged] += m2[merged] + delta[merged] ** 2 * self.count[merged] * count[merged] / total[merged]
+        self.count = total
+
+    def variance(self):
+        return np.divide(self.m2, self.count - 1, out=np.full_like(self.m2, np.nan), where=self.count > 1)
+
+
+def average_series(store, world_size, density, method):
+    # Per-time-step mean and standard deviation of every metric over the configuration's runs,
+    # read from the mapped store in chunks
+    running = {metric: RunningStats() for metric in metrics}
+    time_steps = np.arange(store.steps)
+    for metric in metrics:
+        runs = store.series(store_series[metric], world_size, density, method)
+        for lo in range(0, len(runs), chunk_size):
+            block = runs[lo:lo + chunk_size]
+            running[metric].update(np.tile(time_steps, len(block)), block.ravel())
+    means = {metric: pd.Series(stats_.mean[stats_.count > 0]) for metric, stats_ in running.items()}
+    # Spread between runs at each time step, next to the mean
+    sds = {metric: pd.Series(np.sqrt(stats_.variance()[stats_.count > 0])) for metric, stats_ in running.items()}
+    return means, sds
+
+
+def test_cell(cell):
+    world_size, density, cell_methods = cell
+    store = ResultStore(result_store_path)
+    method_data = {method: average_series(store, world_size, density, method) for method in cell_methods}
     if 'Hybrid' not in method_data:
-        continue 
+        return []
 
+    test_results = []
     for metric in metrics:
-        hybrid_series = method_data['Hybrid'][metric]
+        hybrid_series = method_data['Hybrid'][0][metric]
         for other_method in ['Centralised-end', 'Decentralised']:
             if other_method not in method_data:
-                continue  
-            other_series = method_data[other_method][metric]
+                continue
+            other_series = method_data[other_method][0][metric]
 
 
             t_stat, p_value = stats.ttest_ind(hybrid_series, other_series, equal_var=False)
@@ -78,16 +99,29 @@ for (world_size, density) in world_density_keys:
                 'comparison': f'Hybrid vs {other_method}',
                 'hybrid_mean': round(hybrid_mean, 4),
                 'other_mean': round(other_mean, 4),
+                # Between-run standard deviation, averaged over time steps
+                'hybrid_run_sd': round(method_data['Hybrid'][1][metric].mean(), 4),
+                'other_run_sd': round(method_data[other_method][1][metric].mean(), 4),
                 'p_value': round(p_value, 4),
                 'cohen_d': round(cohen_d, 4)
             })
+    return test_results
+
 
+if __name__ == "__main__":
+    configurations = ResultStore(result_store_path).configurations()
 
-results_df = pd.DataFrame(test_results)
+    # One job per (world_size, density) cell with the methods it has runs for
+    cells = []
+    for (world_size, density) in sorted(set((key[0], key[1]) for key in configurations)):
+        cell_methods = [method for method in methods if (world_size, density, method) in configurations]
+        cells.append((world_size, density, cell_methods))
 
+    with ProcessPoolExecutor() as executor:
+        test_results = [row for rows in executor.map(test_cell, cells) for row in rows]
 
-results_df = results_df[['world_size', 'density', 'metric', 'comparison', 'hybrid_mean', 'other_mean', 'p_value', 'cohen_d']]
 
+    results_df = pd.DataFrame(test_results, columns=['world_size', 'density', 'metric', 'comparison', 'hybrid_mean', 'other_mean', 'hybrid_run_sd', 'other_run_sd', 'p_value', 'cohen_d'])
 
-results_df.to_csv('statistical_test_results.csv', index=False)
 
+    results_df.to_csv('statistical_test_results.csv', index=False)
@@ -0,0 +1,199 @@
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'HYTL'
+VERSION = 1
+
+# Per-step event sections in file order: name, dtype, values per entry
+SECTIONS = (
+    ('moves', '<i4', 2),  # agent id, new cell
+    ('trash', '<i4', 2),  # cell, new trash count
+    ('litter', '<i4', 1),  # agent id
+    ('pickups', '<i4', 1),  # agent id
+    ('sanctions', '<i4', 2),  # sanctioner id, target id
+    ('comp', '<i4', 2),  # agent id, new compliance flag
+    ('compliance', '<i4', 1),  # agent id ...
+    ('compliance_values', '<f8', 1),  # ... and its new compliant probability
+)
+# Step number, entries per section, then average compliance, cleanliness and total sanctions
+STEP_HEADER = struct.Struct('<I' + 'I' * len(SECTIONS) + 'ddq')
+
+
+class TrajectoryLogger:
+    """Observer that writes a GridWorld run as a compact binary event log.
+
+    The file starts with the map and a keyframe of the initial state, then
+    holds one record per step with only what changed: agents that moved,
+    cells whose trash count changed, litterers, pickers, sanctions and
+    compliance flag/probability changes, plus the step's run-level metrics.
+    Cells are flat indices (x * height + y). Further run_env calls append
+    to the same log. Read it back with TrajectoryLog; replay.py renders it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def on_start(self, env):
+        if self.file is not None:
+            self.file = open(self.path, 'ab')
+            return
+        self.positions = self.agent_cells(env)
+        self.trash = env.trash.ravel().copy()
+        self.comp = np.array([agent.comp for agent in env.agents], dtype=bool)
+        self.compliant_prob = np.array([agent.compliant_prob for agent in env.agents], dtype=np.float64)
+        trash_cells = np.flatnonzero(self.trash)
+        header = json.dumps({
+            'width': env.width,
+            'height': env.height,
+            'num_agents': len(env.agents),
+            'method': env.method,
+            'house_positions': [list(p) for p in env.house_positions],
+            'office_position': [list(p) for p in env.office_position],
+            'park_positions': [list(p) for p in env.park_positions],
+            'trash_bins': [list(p) for p in env.trash_bins],
+            'start_step': env.steps_done,
+            'positions': self.positions.tolist(),
+            'comp': self.comp.tolist(),
+            'compliant_prob': self.compliant_prob.tolist(),
+            'trash_cells': trash_cells.tolist(),
+            'trash_counts': self.trash[trash_cells].tolist(),
+        }).encode()
+        self.file = open(self.path, 'wb')
+        self.file.write(MAGIC + struct.pack('<II', VERSION, len(header)) + header)
+
+    def on_step(self, env):
+        step = env.steps_done - 1
+        positions = self.agent_cells(env)
+        moved = np.flatnonzero(positions != self.positions)
+        trash = env.trash.ravel()
+        changed = np.flatnonzero(trash != self.trash)
+        comp = np.array([agent.comp for agent in env.agents], dtype=bool)
+        flipped = np.flatnonzero(comp != self.comp)
+        compliant_prob = np.array([agent.compliant_prob for agent in env.agents], dtype=np.float64)
+        updated = np.flatnonzero(compliant_prob != self.compliant_prob)
+
+        events = env.step_events.get(step, {})
+        litter = sorted(agent_id for ids in events.get('litterers_by_cell', {}).values() for agent_id in ids)
+        sanctions = sorted((sanctioner, target) for target, ids in events.get('sanctions_by_target', {}).items() for sanctioner in ids)
+        actions = env.agent_actions_history.get(step, {})
+        pickups = sorted(agent_id for agent_id, action in actions.items() if action.get('action') == 'pick_up_trash')
+
+        sections = (
+            np.column_stack([moved, positions[moved]]),
+            np.column_stack([changed, trash[changed]]),
+            np.array(litter),
+            np.array(pickups),
+            np.array(sanctions).reshape(-1, 2),
+            np.column_stack([flipped, comp[flipped]]),
+            updated,
+            compliant_prob[updated],
+        )
+        header = STEP_HEADER.pack(
+            step, *(len(values) for values in sections),
+            env.compliance_over_time[-1], env.cleanliness_over_time[-1], env.total_sanctions_over_time[-1]
+        )
+        self.file.write(header + b''.join(np.asarray(values, dtype=dtype).tobytes() for values, (_, dtype, _) in zip(sections, SECTIONS)))
+
+        self.positions = positions
+        self.trash[changed] = trash[changed]
+        self.comp = comp
+        self.compliant_prob = compliant_prob
+        return True
+
+    def on_end(self, env):
+        self.file.close()
+
+    def agent_cells(self, env):
+        return np.array([x * env.height + y for x, y in (agent.current_position for agent in env.agents)], dtype=np.int64)
+
+
+class ReplayState:
+    """World state rebuilt from a log, in the array layout of VectorGridWorld.
+
+    Holds what PygameRenderer draws (map, trash, agent cells, compliance
+    flags and this step's litterers) plus the step's events and metrics.
+    """
+
+    def __init__(self, header):
+        self.width = header['width']
+        self.height = header['height']
+        self.num_agents = header['num_agents']
+        self.num_cells = self.width * self.height
+        self.method = header['method']
+        self.house_positions = [tuple(p) for p in header['house_positions']]
+        self.office_position = [tuple(p) for p in header['office_position']]
+        self.park_positions = [tuple(p) for p in header['park_positions']]
+        self.trash_bins = [tuple(p) for p in header['trash_bins']]
+        self.step = header['start_step'] - 1
+        self.position = np.array(header['positions'], dtype=np.int64)
+        self.comp = np.array(header['comp'], dtype=bool)
+        self.compliant_prob = np.array(header['compliant_prob'], dtype=np.float64)
+        self.trash = np.zeros(self.num_cells, dtype=np.int32)
+        self.trash[header['trash_cells']] = header['trash_counts']
+        self.littered = np.zeros(self.num_agents, dtype=bool)
+        self.events = {}
+        self.average_compliance = float(self.compliant_prob.mean()) if self.num_agents else 0.0
+        self.cleanliness = float((self.trash == 0).mean() * 100)
+        self.total_sanctions = 0
+
+    def apply(self, record):
+        self.step = record['step']
+        moves, trash = record['moves'], record['trash']
+        self.position[moves[:, 0]] = moves[:, 1]
+        self.trash[trash[:, 0]] = trash[:, 1]
+        comp = record['comp']
+        self.comp[comp[:, 0]] = comp[:, 1].astype(bool)
+        self.compliant_prob[record['compliance']] = record['compliance_values']
+        self.littered[:] = False
+        self.littered[record['litter']] = True
+        self.events = record
+        self.average_compliance = record['average_compliance']
+        self.cleanliness = record['cleanliness']
+        self.total_sanctions = record['total_sanctions']
+
+
+class TrajectoryLog:
+    """Reader for the logs TrajectoryLogger writes."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.header, self.data_offset = self.read_header(f)
+
+    def read_header(self, f):
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{self.path} is not a trajectory log')
+        version, length = struct.unpack('<II', f.read(8))
+        if version != VERSION:
+            raise ValueError(f'{self.path} has log version {version}, expected {VERSION}')
+        return json.loads(f.read(length)), len(MAGIC) + 8 + length
+
+    def records(self):
+        # One dict of event arrays and metrics per logged step; a truncated last record is dropped
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_offset)
+            while True:
+                raw = f.read(STEP_HEADER.size)
+                if len(raw) < STEP_HEADER.size:
+                    return
+                fields = STEP_HEADER.unpack(raw)
+                record = {'step': fields[0]}
+                record['average_compliance'], record['cleanliness'], record['total_sanctions'] = fields[-3:]
+                for (name, dtype, width), count in zip(SECTIONS, fields[1:1 + len(SECTIONS)]):
+                    size = np.dtype(dtype).itemsize * width * count
+                    data = f.read(size)
+                    if len(data) < size:
+                        return
+                    values = np.frombuffer(data, dtype=dtype).astype(np.int64 if dtype == '<i4' else np.float64)
+                    record[name] = values.reshape(-1, width) if width > 1 else values
+                yield record
+
+    def frames(self):
+        # The replayed state after every logged step; the same object is updated in place
+        state = ReplayState(self.header)
+        for record in self.records():
+            state.apply(record)
+            yield state
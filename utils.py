@@ -1,9 +1,10 @@
 import random
 
 def initial_map(num_agents, width, height, seed=44):
-    random.seed(seed)
+    # A private generator gives the same layouts as seeding the global one, without touching it
+    rng = random.Random(seed)
     all_positions = [(x, y) for x in range(width) for y in range(height)]
-    random.shuffle(all_positions)
+    rng.shuffle(all_positions)
 
     occupied_positions = set()
 
@@ -36,7 +37,7 @@ def initial_map(num_agents, width, height, seed=44):
             if pos not in occupied_positions and 0 <= pos[0] < width and 0 <= pos[1] < height
         ]
         if possible_bin_locations:
-            selected_bin = possible_bin_locations.pop(random.randint(0, len(possible_bin_locations) - 1))
+            selected_bin = possible_bin_locations.pop(rng.randint(0, len(possible_bin_locations) - 1))
             trash_bins.append(selected_bin)
             occupied_positions.add(selected_bin)
 
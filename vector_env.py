@@ -0,0 +1,586 @@
+import numpy as np
+
+from env import MAX_PASSABLE_TRASH
+from recorder import MetricsRecorder
+from scenarios import neighbor_table, nearest_bin_table, distance_field
+
+# Action codes, one per agent per step
+NO_ACTION = 0
+DISPOSE = 1
+LITTER = 2
+PICK_UP_TRASH = 3
+SANCTION = 4
+
+# Route legs: what the rest of an agent's planned path leads to
+NO_PATH = 0
+TO_END = 1
+TO_BIN_THEN_END = 2
+TO_CELL = 3
+
+
+class ObservedWorld:
+    """Observer loop and metric accessors shared by the array engines.
+
+    Subclasses provide step(), step_id, observers, recorders (recorder is
+    the one the *_over_time attributes read), clean_cells and num_cells.
+    """
+
+    def run_env(self, steps):
+        for recorder in self.recorders:
+            recorder.reserve(steps)
+        for observer in self.observers:
+            observer.on_start(self)
+        for _ in range(steps):
+            self.step()
+            self.step_id += 1
+            keep_running = True
+            for observer in self.observers:
+                if observer.on_step(self) is False:
+                    keep_running = False
+            if not keep_running:
+                break
+        for observer in self.observers:
+            observer.on_end(self)
+
+    def count_clean_squares(self):
+        # Per replica for VectorGridWorld
+        return self.clean_cells
+
+    def compute_percentage_clean_cells(self):
+        return self.clean_cells / self.num_cells * 100
+
+    @property
+    def compliance_over_time(self):
+        return self.recorder.series('average_compliance')
+
+    @property
+    def cleanliness_over_time(self):
+        return self.recorder.series('cleanliness')
+
+    @property
+    def total_sanctions_over_time(self):
+        return self.recorder.series('total_sanctions')
+
+    @property
+    def clean_squares_record(self):
+        return self.recorder.series('clean_squares')
+
+    def get_average_compliance_over_time(self):
+        return self.compliance_over_time
+
+
+class VectorGridWorld(ObservedWorld):
+    """Struct-of-arrays version of GridWorld for large populations.
+
+    Agent state lives in NumPy arrays indexed by agent id and grid cells are
+    flat indices (x * height + y). Every phase of a step (observe, choose,
+    apply, update) runs as batched array operations with the same rules as
+    GridWorld/CleaningAgent. Paths are not stored per agent: an agent keeps
+    the goal of its current leg and steps down that goal's shared distance
+    field. Fields are refreshed when an agent meets a blocked cell, which is
+    when CleaningAgent would replan.
+
+    With replicas=K the world holds K independent runs on the same map,
+    stepped in lockstep: replica r owns agents r*num_agents onwards and the
+    cells r*width*height onwards of a grid of K disjoint copies of the map.
+    Static tables are built once and tiled, and a goal's distance field is
+    one BFS covering every replica. Per-replica series are in recorders;
+    recorder and the *_over_time attributes refer to replica 0. Observers
+    would only see replica 0 while stopping every replica, so they are
+    refused with replicas > 1.
+
+    A scenarios.Scenario of the same map supplies the static tables and
+    the empty-map goal fields instead of building them.
+    """
+
+    # Per-agent state arrays, in the order they are created
+    AGENT_FIELDS = (
+        'replica', 'start', 'end', 'position', 'compliant_prob', 'initial_compliant_prob', 'sanctioned', 'trash_count',
+        'comp', 'was_sanctioned', 'has_littered_this_trip', 'is_dead', 'steps_since_start', 'trip_id', 'action',
+        'leg', 'leg_goal', 'leg_origin', 'hold', 'littered', 'littering_agents',
+    )
+
+    def __init__(self, width, height, num_agents, method, b, initial_compliant_probs, house_positions, office_position, park_positions, trash_bins, num_run, t, observation_radius, seed=None, observers=None, replicas=1, scenario=None):
+        if observers and replicas > 1:
+            raise ValueError('Observers see only replica 0, so they cannot be used with replicas > 1')
+        self.width = width
+        self.height = height
+        self.num_agents = num_agents
+        self.method = method
+        self.b = b
+        self.num_run = num_run
+        self.t = t
+        self.observation_radius = observation_radius
+        self.house_positions = house_positions
+        self.office_position = office_position
+        self.park_positions = park_positions
+        self.trash_bins = trash_bins
+        self.rng = np.random.default_rng(seed)
+        self.step_id = 0
+        self.replicas = replicas
+        # Replica of every agent
+        self.replica = np.repeat(np.arange(replicas), num_agents)
+        self.total_sanctions = np.zeros(replicas, dtype=np.int64)
+        self.recorders = [MetricsRecorder(num_agents) for _ in range(replicas)]
+        self.recorder = self.recorders[0]
+        # Same observer protocol as GridWorld; on_step returning False ends the run
+        self.observers = list(observers) if observers else []
+        self.stop_step = None
+
+        # Static map tables
+        self.num_cells = width * height
+        self.total_cells = replicas * self.num_cells
+        self.build_map(scenario)
+
+        # Dynamic grid state
+        self.trash = np.zeros(self.total_cells, dtype=np.int32)
+        self.clean_cells = np.full(replicas, self.num_cells, dtype=np.int64)
+        self.passable = np.ones(self.total_cells, dtype=bool)
+        self.passability_version = 0
+        self.flow_fields = {}
+        self.field_versions = {}
+        # Goals whose field came from a scenario and has not been asked for yet
+        self.preloaded_fields = set()
+        self.trash_field = None
+        if scenario is not None:
+            self.load_goal_fields(scenario)
+
+        # Agent state
+        self.start, self.compliant_prob = self.initial_agents(initial_compliant_probs)
+        total_agents = len(self.start)
+        self.total_agents = total_agents
+        self.end = self.pick_destinations(self.start, self.cells(office_position + park_positions + house_positions))
+        self.position = self.start.copy()
+        self.initial_compliant_prob = self.compliant_prob.copy()
+        self.sanctioned = np.zeros(total_agents, dtype=np.int64)
+        self.trash_count = np.ones(total_agents, dtype=np.int64)
+        self.comp = np.zeros(total_agents, dtype=bool)
+        self.was_sanctioned = np.zeros(total_agents, dtype=bool)
+        self.has_littered_this_trip = np.zeros(total_agents, dtype=bool)
+        self.is_dead = np.zeros(total_agents, dtype=bool)
+        self.steps_since_start = np.zeros(total_agents, dtype=np.int64)
+        self.trip_id = np.zeros(total_agents, dtype=np.int64)
+        self.action = np.zeros(total_agents, dtype=np.int8)
+
+        # Route state standing in for CleaningAgent.path
+        self.leg = np.zeros(total_agents, dtype=np.int8)
+        self.leg_goal = np.zeros(total_agents, dtype=np.int64)
+        self.leg_origin = np.zeros(total_agents, dtype=np.int64)
+        self.hold = np.zeros(total_agents, dtype=bool)
+
+        # Previous step's events
+        self.littered = np.zeros(total_agents, dtype=bool)
+        self.sanction_pairs = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        self.littering_agents = np.zeros(total_agents, dtype=bool)
+        self.time_since_last_check = 0
+
+    def build_map(self, scenario):
+        # Static map tables, built for one copy of the map and tiled over the replicas
+        bin_mask = np.zeros(self.num_cells, dtype=bool)
+        bin_mask[self.cells(self.trash_bins)] = True
+        self.bin_mask = np.tile(bin_mask, self.replicas)
+        home_or_office_mask = np.zeros(self.num_cells, dtype=bool)
+        home_or_office_mask[self.cells(self.house_positions + self.office_position)] = True
+        self.home_or_office_mask = np.tile(home_or_office_mask, self.replicas)
+        self.destinations = self.cells(self.house_positions + self.office_position + self.park_positions)
+        if scenario is not None:
+            neighbors, nearest_bin = scenario.neighbors, scenario.nearest_bin
+        else:
+            neighbors, nearest_bin = neighbor_table(self.width, self.height), nearest_bin_table(self.width, self.height, self.cells(self.trash_bins))
+        self.neighbors = self.tile_cells(neighbors)
+        self.nearest_bin = self.tile_cells(nearest_bin)
+
+    def load_goal_fields(self, scenario):
+        # Empty-map fields hold until the first passability change
+        for goal, field in zip(scenario.goals.tolist(), scenario.goal_fields):
+            self.flow_fields[goal] = field if self.replicas == 1 else np.tile(field, self.replicas)
+            self.field_versions[goal] = self.passability_version
+            self.preloaded_fields.add(goal)
+
+    def initial_agents(self, initial_compliant_probs):
+        # Start cell and compliance of every agent; agents start at the houses in turn
+        houses = self.cells(self.house_positions)
+        start = np.tile(houses[np.arange(self.num_agents) % len(houses)], self.replicas) + self.replica * self.num_cells
+        return start, np.tile(np.asarray(initial_compliant_probs, dtype=np.float64), self.replicas)
+
+    def cells(self, positions):
+        return np.array([x * self.height + y for x, y in positions], dtype=np.int64)
+
+    def tile_cells(self, table):
+        # Repeat a per-cell table of cell ids for every replica, shifting ids into that replica's copy
+        if self.replicas == 1:
+            return table
+        offsets = (np.arange(self.replicas) * self.num_cells).reshape((-1,) + (1,) * table.ndim)
+        tiled = np.where(table >= 0, table + offsets, table)
+        return tiled.reshape((-1,) + table.shape[1:])
+
+    def pick_destinations(self, current, choices):
+        # Uniform choice among choices (cells of one map copy) other than the agent's current cell
+        if len(current) == 0 or len(choices) == 0:
+            return current.copy()
+        offset = current - current % self.num_cells
+        # Index of each agent's own cell among choices, -1 if it is not one of them
+        order = np.argsort(choices, kind='stable')
+        slot = np.minimum(np.searchsorted(choices[order], current - offset), len(choices) - 1)
+        own = np.where(choices[order][slot] == current - offset, order[slot], -1)
+        others = np.where(own >= 0, len(choices) - 1, len(choices))
+        picked = (self.rng.random(len(current)) * others).astype(np.int64)
+        picked += (own >= 0) & (picked >= own)
+        return np.where(others > 0, offset + choices[np.minimum(picked, len(choices) - 1)], current)
+
+    # Distance fields
+
+    def compute_distance_field(self, sources):
+        return distance_field(self.neighbors, self.passable, sources)
+
+    def get_flow_field(self, goal, fresh=False):
+        # goal is a cell of one map copy; the field leads to that cell in every replica
+        field = self.flow_fields.get(goal)
+        if goal in self.preloaded_fields:
+            # A stored field stands in for the first build only while the map is still empty,
+            # so runs match those without a scenario
+            self.preloaded_fields.discard(goal)
+            if self.field_versions[goal] != self.passability_version:
+                field = None
+        if field is None or (fresh and self.field_versions[goal] != self.passability_version):
+            field = self.build_flow_field(goal)
+            self.flow_fields[goal] = field
+            self.field_versions[goal] = self.passability_version
+        return field
+
+    def build_flow_field(self, goal):
+        return self.compute_distance_field(goal + np.arange(self.replicas, dtype=np.int64) * self.num_cells)
+
+    def field_keys(self, goals):
+        # Fields are cached per cell of one map copy
+        return goals % self.num_cells
+
+    def passable_goals(self, goals):
+        return self.passable[goals]
+
+    def get_trash_field(self):
+        if self.trash_field is None:
+            self.trash_field = self.compute_distance_field(np.flatnonzero(self.trash))
+        return self.trash_field
+
+    def next_hops(self, cells, field):
+        # One step down field from each cell; ties broken at random like GridWorld.follow_field
+        candidates = self.neighbors[cells]
+        distance = np.where(candidates >= 0, field[candidates], -1).astype(np.int64)
+        finite = distance >= 0
+        best = np.where(finite, distance, np.iinfo(np.int64).max).min(axis=1, keepdims=True)
+        usable = finite & (distance == best) & self.passable[np.maximum(candidates, 0)]
+        noise = np.where(usable, self.rng.random(candidates.shape), np.inf)
+        choice = noise.argmin(axis=1)
+        found = usable.any(axis=1)
+        return np.where(found, candidates[np.arange(len(cells)), choice], cells), found
+
+    def reachable(self, cells, goals):
+        # Whether a path from each cell to its goal exists, as GridWorld.get_path would report.
+        # A blocked goal is always caught; other new blockages are found once an agent walks into them.
+        result = cells == goals
+        pending = ~result & self.passable_goals(goals)
+        local_goals = self.field_keys(goals)
+        for goal in np.unique(local_goals[pending]):
+            group = np.flatnonzero((local_goals == goal) & pending)
+            for fresh in (False, True):
+                field = self.get_flow_field(goal, fresh)
+                candidates = self.neighbors[cells[group]]
+                ok = ((candidates >= 0) & (field[np.maximum(candidates, 0)] >= 0)).any(axis=1)
+                if ok.all() or self.field_versions[goal] == self.passability_version:
+                    break
+            result[group] = ok
+        return result
+
+    def follow(self, agents, goals):
+        hops = np.empty(len(agents), dtype=np.int64)
+        found = np.zeros(len(agents), dtype=bool)
+        cells = self.position[agents]
+        local_goals = self.field_keys(goals)
+        for goal in np.unique(local_goals):
+            group = np.flatnonzero(local_goals == goal)
+            hops[group], found[group] = self.next_hops(cells[group], self.get_flow_field(goal))
+            retry = group[~found[group]]
+            if len(retry) and self.field_versions[goal] != self.passability_version:
+                hops[retry], found[retry] = self.next_hops(cells[retry], self.get_flow_field(goal, fresh=True))
+        return hops, found
+
+    def descend(self, cells, field):
+        # Walk every cell down to a distance-0 cell of field in lockstep
+        cells = cells.copy()
+        active = field[cells] != 0
+        while active.any():
+            hops, found = self.next_hops(cells[active], field)
+            index = np.flatnonzero(active)
+            cells[index] = hops
+            active[index[~found]] = False
+            active &= field[cells] != 0
+        return cells
+
+    # Neighbourhood queries
+
+    def pairs_within(self, sources, targets, positions):
+        # All (source, target) agent pairs at Manhattan distance <= observation_radius, excluding self pairs
+        if len(sources) == 0 or len(targets) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        radius = self.observation_radius
+        order = np.argsort(positions[targets], kind='stable')
+        sorted_targets = targets[order]
+        sorted_cells = positions[sorted_targets]
+        # x runs over the replicas' map copies side by side; stay within the source's copy
+        sx, sy = np.divmod(positions[sources], self.height)
+        local_x = sx % self.width
+        found_sources, found_targets = [], []
+        for dx in range(-radius, radius + 1):
+            span = radius - abs(dx)
+            for dy in range(-span, span + 1):
+                nx, ny = sx + dx, sy + dy
+                inside = (local_x + dx >= 0) & (local_x + dx < self.width) & (ny >= 0) & (ny < self.height)
+                cell = nx * self.height + ny
+                lo = np.searchsorted(sorted_cells, cell, side='left')
+                hi = np.searchsorted(sorted_cells, cell, side='right')
+                counts = np.where(inside, hi - lo, 0)
+                total = counts.sum()
+                if total == 0:
+                    continue
+                starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+                found_sources.append(np.repeat(sources, counts))
+                found_targets.append(sorted_targets[starts + np.arange(total)])
+        if not found_sources:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        found_sources = np.concatenate(found_sources)
+        found_targets = np.concatenate(found_targets)
+        keep = found_sources != found_targets
+        found_sources, found_targets = found_sources[keep], found_targets[keep]
+        order = np.lexsort((found_targets, found_sources))
+        return found_sources[order], found_targets[order]
+
+    # Simulation
+
+    def step(self):
+        observed = self.position.copy()
+
+        # Step 1: Observe last step's litterers and sanctions within the observation radius
+        sanctions_received = self.observe_sanctions(observed)
+
+        # Step 2: Decide on actions
+        move = self.choose_actions(observed)
+
+        # Step 3: Apply all actions
+        self.apply_actions(observed, move)
+
+        self.time_since_last_check += 1
+        if self.method == 'Centralised-ts' and self.time_since_last_check == self.t:
+            self.sanctioned[self.littering_agents] += 1
+            self.has_littered_this_trip[self.littering_agents] = False
+            self.time_since_last_check = 0
+            self.littering_agents[:] = False
+
+        if self.method == 'Centralised-end' or self.method == 'Hybrid':
+            checked = self.central_checks()
+            caught = self.has_littered_this_trip & (self.position == self.end) & checked[self.replica]
+            self.sanctioned[caught] += 1
+            self.total_sanctions += np.bincount(self.replica[caught], minlength=self.replicas)
+            self.has_littered_this_trip[caught] = False
+
+        # Step 4: Update internal state
+        self.update_internal_state(sanctions_received)
+
+        self.record_metrics()
+
+    def observe_sanctions(self, observed):
+        # Sanctions of last step whose sanctioner is still in view of its target
+        sanctioners, targets = self.sanction_pairs
+        close = np.abs(observed[sanctioners] // self.height - observed[targets] // self.height) + np.abs(observed[sanctioners] % self.height - observed[targets] % self.height) <= self.observation_radius
+        return np.bincount(targets[close], minlength=len(self.position))
+
+    def central_checks(self):
+        # Whether the central check runs this step, per replica; Hybrid replicas each draw their own
+        if self.method == 'Centralised-end':
+            return np.ones(self.replicas, dtype=bool)
+        return self.rng.random(self.replicas) >= self.b
+
+    def record_metrics(self):
+        compliant_prob = self.compliant_prob.reshape(self.replicas, -1)
+        sanctioned = self.sanctioned.reshape(self.replicas, -1)
+        average_compliance = compliant_prob.mean(axis=1)
+        for r, recorder in enumerate(self.recorders):
+            recorder.record(
+                compliant_prob[r], sanctioned[r], average_compliance[r],
+                self.clean_cells[r], self.clean_cells[r] / self.num_cells * 100, self.total_sanctions[r]
+            )
+
+    def choose_actions(self, observed):
+        action = self.action
+        action[:] = NO_ACTION
+        move = observed.copy()
+        has_trash = (self.clean_cells < self.num_cells)[self.replica]
+
+        # Sanctioned agents pick up trash where they stand or head for the nearest trash
+        picking = self.was_sanctioned & (self.trash[observed] > 0)
+        pickers = np.flatnonzero(picking)
+        action[pickers] = PICK_UP_TRASH
+        self.trash_count[pickers] += 1
+        bins = self.nearest_bin[observed[pickers]]
+        to_bin = self.reachable(observed[pickers], bins)
+        self.set_leg(pickers, np.where(to_bin, TO_CELL, NO_PATH), bins)
+        self.hold[pickers] = to_bin
+
+        seeking = self.was_sanctioned & ~picking & has_trash
+        seekers = np.flatnonzero(seeking)
+        if len(seekers):
+            field = self.get_trash_field()
+            cells = observed[seekers]
+            hops, found = self.next_hops(cells, field)
+            found |= field[cells] == 0
+            goals = self.descend(np.where(found, hops, cells), field)
+            self.set_leg(seekers, np.where(found, TO_CELL, NO_PATH), goals)
+            self.hold[seekers] = False
+            self.is_dead[seekers[~found]] = True
+        self.was_sanctioned[picking] = False
+
+        # Then decide whether to litter or dispose
+        deciding = ~picking & ~seeking
+        carrying = deciding & (self.trash_count > 0)
+        disposing = carrying & self.bin_mask[observed]
+        littering = carrying & ~disposing & ~self.comp & ~self.home_or_office_mask[observed]
+        action[disposing] = DISPOSE
+        action[littering] = LITTER
+        self.trash_count[disposing | littering] = 0
+        self.has_littered_this_trip[littering] = True
+
+        # Walk the current leg; a blocked next cell or a used-up leg means a replan and a step in place
+        walking = deciding & ~disposing & ~littering
+        holding = walking & self.hold
+        stuck = holding & ~self.passable[observed]
+        holding &= ~stuck
+        self.hold[walking] = False
+        used_up = (self.leg == NO_PATH) | ((self.leg == TO_CELL) & (observed == self.leg_goal))
+        following = np.flatnonzero(walking & ~holding & ~stuck & ~used_up)
+        replanning = walking & ~holding & (stuck | used_up)
+
+        at_bin = (self.leg[following] == TO_BIN_THEN_END) & (observed[following] == self.leg_goal[following])
+        arrived, onward = following[at_bin], following[~at_bin]
+        if len(arrived):
+            # The planned route resumes from where it was planned, as CleaningAgent.choose_path builds it
+            saved = self.position[arrived]
+            self.position[arrived] = self.leg_origin[arrived]
+            hops, found = self.follow(arrived, self.end[arrived])
+            self.position[arrived] = saved
+            move[arrived[found]] = hops[found]
+            self.leg[arrived[found]] = TO_END
+            replanning[arrived[~found]] = True
+        if len(onward):
+            goals = np.where(self.leg[onward] == TO_END, self.end[onward], self.leg_goal[onward])
+            hops, found = self.follow(onward, goals)
+            move[onward[found]] = hops[found]
+            done = found & (self.leg[onward] == TO_CELL) & (hops == goals)
+            self.leg[onward[done]] = NO_PATH
+            replanning[onward[~found]] = True
+
+        planners = np.flatnonzero(replanning)
+        dead = planners[~self.plan_routes(planners, observed[planners])]
+        self.is_dead[dead] = True
+        walking[dead] = False
+        move[dead] = observed[dead]
+
+        # Finally, decide whether to sanction last step's litterers in view
+        if self.method == 'Decentralised' or self.method == 'Hybrid':
+            willing = walking & self.comp
+            if self.method == 'Hybrid':
+                willing &= self.rng.random(len(willing)) < self.b
+            sanctioners, targets = self.choose_sanctions(willing, observed)
+            action[sanctioners] = SANCTION
+        else:
+            sanctioners = targets = np.zeros(0, dtype=np.int64)
+        self.sanction_pairs = (sanctioners, targets)
+        return move
+
+    def choose_sanctions(self, willing, observed):
+        # Every last-step litterer in view of a willing agent is sanctioned by it
+        return self.pairs_within(np.flatnonzero(willing), np.flatnonzero(self.littered), observed)
+
+    def set_leg(self, agents, legs, goals):
+        self.leg[agents] = legs
+        self.leg_goal[agents] = goals
+        self.leg_origin[agents] = self.position[agents]
+
+    def plan_routes(self, agents, cells):
+        # CleaningAgent.choose_path: compliant agents go via the nearest bin, others go direct
+        ends = self.end[agents]
+        to_end = self.reachable(cells, ends)
+        bins = self.nearest_bin[cells]
+        via_bin = self.comp[agents] & (cells != bins)
+        via_bin[via_bin] = self.reachable(cells[via_bin], bins[via_bin])
+        self.set_leg(agents, np.where(via_bin, TO_BIN_THEN_END, TO_END), np.where(via_bin, bins, ends))
+        self.leg[agents[~to_end]] = NO_PATH
+        return to_end
+
+    def apply_actions(self, observed, move):
+        self.was_sanctioned[:] = False
+
+        # Moves into impassable cells are refused
+        self.position = np.where(self.passable[move], move, observed)
+
+        littering = self.action == LITTER
+        picking = self.action == PICK_UP_TRASH
+        changed = np.unique(np.concatenate([observed[littering], observed[picking]]))
+        if len(changed):
+            before = self.trash[changed]
+            added = np.bincount(observed[littering], minlength=self.total_cells)[changed]
+            removed = np.bincount(observed[picking], minlength=self.total_cells)[changed]
+            self.apply_trash(changed, np.maximum(before + added - removed, 0))
+
+        self.littered = littering
+        if self.method == 'Centralised-ts':
+            self.littering_agents |= littering
+
+        sanctioners, targets = self.sanction_pairs
+        self.was_sanctioned[targets] = True
+        self.total_sanctions += np.bincount(self.replica[targets], minlength=self.replicas)
+
+    def apply_trash(self, changed, after):
+        # Set the trash on the given cells, keeping clean counts, passability and the trash field in step
+        before = self.trash[changed]
+        self.trash[changed] = after
+        cleaned = ((before > 0) & (after == 0)).astype(np.int64) - ((before == 0) & (after > 0))
+        self.clean_cells += np.bincount(changed // self.num_cells, weights=cleaned, minlength=self.replicas).astype(np.int64)
+        passable = (after <= MAX_PASSABLE_TRASH) | self.bin_mask[changed]
+        if (passable != self.passable[changed]).any():
+            self.passable[changed] = passable
+            self.passability_version += 1
+            self.trash_field = None
+        if ((before == 0) != (after == 0)).any():
+            self.trash_field = None
+
+    def update_internal_state(self, sanctions_received):
+        # Reset compliance at start position
+        at_start = self.position == self.start
+        self.comp[at_start] = self.rng.random(int(at_start.sum())) < self.compliant_prob[at_start]
+        self.trash_count[at_start] += 1
+        self.steps_since_start[at_start] = 0
+        self.has_littered_this_trip[at_start] = False
+
+        at_end = self.position == self.end
+        if self.method == 'Hybrid':
+            caught = at_end & self.has_littered_this_trip
+            self.sanctioned[caught] += 1
+            self.total_sanctions += np.bincount(self.replica[caught], minlength=self.replicas)
+        self.compliant_prob[at_end] = self.sigmoid(self.sanctioned[at_end], k=0.5, x0=0)
+        self.steps_since_start[at_end] = 0
+        self.steps_since_start[~at_end] += 1
+        self.has_littered_this_trip[at_end] = False
+        arrived = np.flatnonzero(at_end)
+        self.start[arrived] = self.position[arrived]
+        self.end[arrived] = self.pick_destinations(self.position[arrived], self.destinations)
+        self.trip_id[arrived] += 1
+        self.leg[arrived] = NO_PATH
+        self.hold[arrived] = False
+
+        if self.method == 'Decentralised' or self.method == 'Hybrid':
+            self.sanctioned += sanctions_received
+
+    def sigmoid(self, x, k, x0):
+        return 1 / (1 + np.exp(-k * (x - x0)))